@@ -0,0 +1,260 @@
+"""
+ Benchmarks of site parsers on pages from benchmarks/fixtures.
+
+ python -m benchmarks run [--sites ria mir24] [--repeat 50] [--out results.json]
+ python -m benchmarks compare old.json new.json
+ python -m benchmarks record ria --days 1 --limit 10
+
+ Fixtures are kept in fixtures/<site>/list and fixtures/<site>/article. Pages shipped with the repo are
+ synthetic copies of the sites markup, record adds real article pages fetched from the site.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+try:
+    import resource
+except ImportError:
+    # no resource module on Windows
+    resource = None
+
+from webparser.registry import SITE_PARSERS, load_parser_class
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def make_parser(site, **kwargs):
+    parser_class = load_parser_class(site)
+    return parser_class({}, 'critical', 0, 10, logging.NullHandler(), **kwargs)
+
+
+def load_fixtures(site, kind):
+    """ Return list of (name, page) for the site, listing pages of profile.ru are json with html inside """
+    directory = os.path.join(FIXTURES_DIR, site, kind)
+    fixtures = []
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), encoding='utf-8') as file:
+            page = file.read()
+        if name.endswith('.json'):
+            page = json.loads(page)['html']
+        fixtures.append((name, page))
+    return fixtures
+
+
+def peak_rss_mb():
+    if not resource:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+def latency_stats(latencies):
+    total = sum(latencies)
+    return {'pages': len(latencies),
+            'pages_per_sec': round(len(latencies) / total, 2) if total else None,
+            'p50_ms': round(statistics.median(latencies) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 3)}
+
+
+def _run_micro_case(site, kind, repeat):
+    """ Runs in a fresh process, so peak RSS belongs to this case only """
+    parser = make_parser(site)
+    method = parser.process_parse_list_articles if kind == 'list' else parser.process_parse_page
+    fixtures = load_fixtures(site, kind)
+    for _, page in fixtures:
+        # warm up caches and lazy imports
+        method(page)
+    latencies = []
+    for _ in range(repeat):
+        for name, page in fixtures:
+            start = time.perf_counter()
+            method(page)
+            latencies.append(time.perf_counter() - start)
+    result = {'benchmark': '%s.%s' % (site, 'process_parse_list_articles' if kind == 'list' else 'process_parse_page'),
+              'fixtures': len(fixtures)}
+    result.update(latency_stats(latencies))
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+class FixtureServer():
+    """ Local stand-in of a site: serves article fixtures at /page/<n> with the given latency """
+    def __init__(self, site, latency=0.05, host='127.0.0.1', port=0):
+        self.pages = [page for _, page in load_fixtures(site, 'article')]
+        self.latency = latency
+        self.host = host
+        self.port = port
+        self._loop = None
+        self._started = threading.Event()
+
+    def url(self, number):
+        return 'http://%s:%s/page/%s' % (self.host, self.port, number)
+
+    async def _handle(self, request):
+        from aiohttp import web
+
+        await asyncio.sleep(self.latency)
+        page = self.pages[int(request.match_info['number']) % len(self.pages)]
+        return web.Response(text=page, content_type='text/html', charset='utf-8')
+
+    def _serve(self):
+        from aiohttp import web
+
+        self._loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.router.add_get('/page/{number}', self._handle)
+        self._runner = web.AppRunner(app)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, self.host, self.port)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._started.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+
+    def __enter__(self):
+        threading.Thread(target=self._serve, daemon=True).start()
+        self._started.wait()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def _run_end_to_end_case(site, pages, latency, concurrency, parse_workers):
+    with FixtureServer(site, latency) as server:
+        parser = make_parser(site, max_concurrency=concurrency, parse_workers=parse_workers,
+                             requests_per_second=None)
+        # fixture server is one host for all sites, so host politeness doesn't apply here
+        parser.site = '%s-benchmark' % site
+        list_urls = [server.url(number) for number in range(pages)]
+        start = time.perf_counter()
+        results = parser.parse(list_urls)
+        elapsed = time.perf_counter() - start
+    return {'benchmark': '%s.parse' % site, 'pages': pages, 'collected': len(results),
+            'latency_ms': latency * 1000, 'concurrency': concurrency, 'parse_workers': parse_workers,
+            'wall_sec': round(elapsed, 3), 'pages_per_sec': round(pages / elapsed, 2),
+            'peak_rss_mb': peak_rss_mb()}
+
+
+def _in_fresh_process(function, *args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+        return executor.submit(function, *args).result()
+
+
+def git_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    results = []
+    for site in args.sites:
+        for kind in ('list', 'article'):
+            result = _in_fresh_process(_run_micro_case, site, kind, args.repeat)
+            print_result(result)
+            results.append(result)
+        if args.pages:
+            result = _in_fresh_process(_run_end_to_end_case, site, args.pages, args.latency / 1000,
+                                       args.concurrency, args.parse_workers)
+            print_result(result)
+            results.append(result)
+
+    report = {'version': git_version(), 'python': platform.python_version(), 'platform': platform.platform(),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=4)
+    return report
+
+
+def print_result(result):
+    print('%-45s %10s pages/sec  p50 %s ms  p99 %s ms  peak rss %s MB'
+          % (result['benchmark'], result['pages_per_sec'], result.get('p50_ms', '-'),
+             result.get('p99_ms', '-'), result['peak_rss_mb']), file=sys.stderr)
+
+
+def compare(args):
+    """ Print change of pages/sec and latencies of the new results relative to the old ones """
+    with open(args.old, encoding='utf-8') as file:
+        old = {result['benchmark']: result for result in json.load(file)['results']}
+    with open(args.new, encoding='utf-8') as file:
+        new = {result['benchmark']: result for result in json.load(file)['results']}
+    for benchmark in sorted(set(old) & set(new)):
+        changes = []
+        for metric in ('pages_per_sec', 'p50_ms', 'p99_ms', 'peak_rss_mb'):
+            if old[benchmark].get(metric) and new[benchmark].get(metric):
+                changes.append('%s %+.1f%%' % (metric, (new[benchmark][metric] / old[benchmark][metric] - 1) * 100))
+        print('%-45s %s' % (benchmark, '  '.join(changes)))
+
+
+def record(args):
+    """ Fetch real listing and article pages of the site and save them as fixtures """
+    parser = make_parser(args.site, requests_per_second=1)
+    list_urls = parser.collect_list_urls(args.days)[:args.limit]
+    directory = os.path.join(FIXTURES_DIR, args.site, 'article')
+    for number, url in enumerate(list_urls):
+        page = parser.get_page(url)
+        with open(os.path.join(directory, 'recorded-%s.html' % number), 'w', encoding='utf-8') as file:
+            file.write(page)
+        print('Recorded %s' % url, file=sys.stderr)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmarks of site parsers')
+    subparsers = arg_parser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run', help='run benchmarks')
+    run_parser.add_argument('--sites', nargs='+', default=list(SITE_PARSERS), choices=list(SITE_PARSERS))
+    run_parser.add_argument('--repeat', type=int, default=20, help='how many times every fixture is parsed')
+    run_parser.add_argument('--pages', type=int, default=200, help='pages for end-to-end parse(), 0 to skip it')
+    run_parser.add_argument('--latency', type=float, default=50, help='latency of the local server, ms')
+    run_parser.add_argument('--concurrency', type=int, default=20)
+    run_parser.add_argument('--parse-workers', type=int, default=0)
+    run_parser.add_argument('--out', help='file for machine-readable results')
+
+    compare_parser = subparsers.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+
+    record_parser = subparsers.add_parser('record', help='record real pages of the site as fixtures')
+    record_parser.add_argument('site', choices=list(SITE_PARSERS))
+    record_parser.add_argument('--days', type=int, default=0)
+    record_parser.add_argument('--limit', type=int, default=10)
+
+    args = arg_parser.parse_args(argv)
+    if args.command == 'compare':
+        compare(args)
+    elif args.command == 'record':
+        record(args)
+    else:
+        if args.command is None:
+            args = run_parser.parse_args([])
+        report = run(args)
+        if not args.out:
+            print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,32 +1,27 @@
 import re
 from datetime import date, timedelta
 
-from bs4 import BeautifulSoup
-from bs4.element import NavigableString
-
-import dateparser
-
-from webparser.base import BaseParser, module_logger
+from webparser.base import BaseParser
+from webparser.dates import DateParser
+from webparser.soup import class_xpath
+from webparser.models import Article, ContentBlock, Image
 
 class MIR24_Parser(BaseParser):
     site = 'mir24.tv'
     url_list_articles = 'https://mir24.tv/rasteniya/simple/list/filter/all/'
-
-    #  Getting all links to articles works in sync mode, which slows down the parsing speed,
-    #  but on the other hand, does not load the site with requests, which reduces the likelihood of blocking
-    def collect_list_urls(self, parse_for_days=-1):
+    date_parser = DateParser(['%H %M %d %m %Y'])
+    list_subtrees = (class_xpath('pd', 'div'),)
+    article_subtrees = (class_xpath('article-second', 'div'), class_xpath('postcontent', 'div'))
+    # the site had publication_date as str in dicts from the start
+    publication_date_format = 'str'
+
+    #  Pages of the list of articles are requested one by one, because every request depends on the previous one.
+    #  It doesn't load the site with requests, which reduces the likelihood of blocking
+    async def _collect_list_urls(self, session, parse_to_date=None):
         list_urls = []
-        current_date = date.today()
-        if parse_for_days>=0:
-            parse_to_date = current_date - timedelta(parse_for_days)
-            message = ' for last %s days' % parse_for_days
-        else:
-            parse_to_date = None
-            message = ''
-
         articles_per_page = 50
         count_recent = 0
-        last_article_date = current_date
+        last_article_date = date.today()
         penult_article_date = last_article_date + timedelta(days=1)
         while last_article_date != penult_article_date:
             if parse_to_date:
@@ -35,27 +30,26 @@ class MIR24_Parser(BaseParser):
             penult_article_date = last_article_date
 
             count_recent += articles_per_page
-            html_data = self.get_page(self.url_list_articles+str(count_recent))
+            html_data = await self._get_page(self.url_list_articles+str(count_recent), session)
             links_to_articles, last_article_date = self.process_parse_list_articles(html_data, parse_to_date)
+            # incremental crawling: older pages were collected in previous runs
+            if self._is_known_page(links_to_articles):
+                self.module_logger.info('[%s] All articles on the page were collected before, stop collecting.'
+                                        % self.site)
+                break
             list_urls.extend(links_to_articles)
 
-        # return unique values
-        list_urls = list(set(list_urls))
-        module_logger.info('On the site %s found %s links to articles%s.'
-                           % (self.site, len(list_urls), message))
         return list_urls
 
     def process_parse_list_articles(self, html_data, parse_to_date=None, *args, **kwargs):
-        soup = BeautifulSoup(html_data, 'lxml')
+        soup = self._make_soup(html_data, self.list_subtrees)
         links_to_articles = []
         last_date = None
 
         for article in soup.find('div', {'class': 'pd'}).find_all('div', {'class': 'ncl-cont'}):
             link = article.find('a', {'class': 'nc-link'}).attrs['href']
             last_date = article.find('span', {'class': 'date-block'}).text
-            last_date = dateparser.parse(last_date,
-                                         settings={'PREFER_DATES_FROM': 'past'},
-                                         date_formats=['%H %M %d %m %Y'])
+            last_date = self.date_parser.parse(last_date, prefer_past=True)
             last_date = last_date.date()
 
             if parse_to_date:
@@ -66,12 +60,15 @@ class MIR24_Parser(BaseParser):
         return links_to_articles, last_date
 
     def process_parse_page(self, html_data, source_url=None):
-        soup = BeautifulSoup(html_data, 'lxml')
-        json_data = {'content': []}
+        # bs4 is imported with the first page, see make_soup
+        from bs4.element import NavigableString
+
+        soup = self._make_soup(html_data, self.article_subtrees)
+        content_blocks = []
 
         # interesting, what means article-first? article-second exist?
         if soup.find('div', {'class': 'article-second'}):
-            module_logger.info('[%s] Found something interesting. Class article-second exists. %s'
+            self.module_logger.info('[%s] Found something interesting. Class article-second exists. %s'
                                % (self.__class__.__name__, source_url))
 
         main_frame = soup.find('div', {'class': 'postcontent'})
@@ -79,19 +76,15 @@ class MIR24_Parser(BaseParser):
         article_body = main_frame.find_all('article')
 
         title = article_header.find(re.compile("\w"), {'class': 'post-title'}).get_text()
-        json_data['title'] = title
 
         publication_date = article_header.find(re.compile("\w"), {'class': 'date-span'}).get_text()
         # TODO check this (date created right)
-        publication_date = dateparser.parse(publication_date, date_formats=['%H %M %d %m %Y'])
-        json_data['publication_date'] = str(publication_date)
+        publication_date = self.date_parser.parse(publication_date)
 
         announce_image = main_frame.find('div', {'class': 'postimage-block'})
         if announce_image:
             announce_image = announce_image.find('img')
-            announce_image = {'image':
-                                  {'source': announce_image.attrs['src']}}
-            json_data['content'].append(announce_image)
+            content_blocks.append(ContentBlock('image', Image(announce_image.attrs['src'], None)))
 
         num_articles = 0
         ignored_data_types = ['em', 'style', 'a']
@@ -102,7 +95,7 @@ class MIR24_Parser(BaseParser):
             num_articles += 1
             # log if we have 2+ articles
             if num_articles>1:
-                module_logger.info('[%s] Found extra articles in news. %s'
+                self.module_logger.info('[%s] Found extra articles in news. %s'
                                % (self.__class__.__name__, source_url))
 
             content_tag = article.find('div', {'class': 'article-content'})
@@ -113,7 +106,7 @@ class MIR24_Parser(BaseParser):
                     continue
                 else:
                     if not tag.name in ignore_wrap and not tag.name in processed_data_types:
-                        module_logger.warning('[%s] Content wrapped unknown tag. Tag: %s. Url: %s'
+                        self.module_logger.warning('[%s] Content wrapped unknown tag. Tag: %s. Url: %s'
                                               % (self.__class__.__name__, f'<{tag.name}>', source_url))
 
             # parse content
@@ -125,14 +118,14 @@ class MIR24_Parser(BaseParser):
                         data_type = 'text'
                     elif item.name=='blockquote':
                         data_type = 'quote'
-                    json_data['content'].append({data_type: text_content})
+                    content_blocks.append(ContentBlock(data_type, text_content))
 
                 # log if found new data type
                 for elem in item.children:
                     if elem.__class__==NavigableString:
                         continue
                     if elem.name not in ignored_data_types and elem.name not in processed_data_types:
-                        module_logger.warning('[%s] Found unknown data type %s for %s'
+                        self.module_logger.warning('[%s] Found unknown data type %s for %s'
                                               % (self.__class__.__name__, f'<{elem.name}>', source_url))
 
-        return json_data
+        return Article(source_url, self.site, title, publication_date, content_blocks)
@@ -1,11 +1,12 @@
 import re
-from datetime import date, timedelta
 import json
-
-from bs4 import BeautifulSoup
-import dateparser
+import math
+import asyncio
 
 from webparser.base import BaseParser
+from webparser.dates import DateParser
+from webparser.soup import class_xpath
+from webparser.models import Article, ContentBlock, Image
 
 
 class ProfileParser(BaseParser):
@@ -15,67 +16,75 @@ class ProfileParser(BaseParser):
                         '&post_type=profile_article,anew&repeater=default&seo_start_page=1&preloaded=false' \
                         '&preloaded_amount=0&tag__and=102439&order=DESC&orderby=date&action=alm_get_posts' \
                         '&query_type=standard'
+    date_parser = DateParser(['%d.%m.%Y %H:%M'])
+    # listing endpoint is almost all list items, parsing the subtrees again costs more than it saves
+    list_subtrees = None
+    article_subtrees = (class_xpath('onenews__body', 'div'), '//figure', class_xpath('publication__data', 'div'),
+                        class_xpath('onenews__title'))
 
-    def collect_list_urls(self, parse_for_days=-1):
-        self.module_logger.info('Start collecting all articles urls from %s.'
-                           % (self.site))
-        list_urls = []
-        current_date = date.today()
-        if parse_for_days>=0:
-            parse_to_date = current_date - timedelta(parse_for_days)
-            message = ' for last %s days' % parse_for_days
-        else:
-            parse_to_date = None
-            message = ''
-
-        num_page = 0
-        get_query = '&page=%s' % num_page
+    posts_per_page = 50
+
+    async def _get_list_page(self, session, num_page):
         # request return json data
-        json_data = self.get_page(self.url_list_articles + get_query)
-        json_data = json.loads(json_data)
-        post_count = json_data['meta']['postcount']
+        json_data = await self._get_page(self.url_list_articles + '&page=%s' % num_page, session)
+        return json.loads(json_data)
+
+    #  The number of pages is known from the first response, so next pages are requested concurrently,
+    #  but not more than max_concurrency pages ahead of the page being processed, to stop early at parse_to_date
+    async def _collect_list_urls(self, session, parse_to_date=None):
+        list_urls = []
+        json_data = await self._get_list_page(session, 0)
         total_post = json_data['meta']['totalposts']
+        num_pages = math.ceil(total_post / self.posts_per_page)
+
+        pending_pages = {}
+        next_page = 1
+        complete = True
+        try:
+            for num_page in range(num_pages):
+                while next_page < num_pages and next_page <= num_page + self._max_concurrency:
+                    pending_pages[next_page] = asyncio.create_task(self._get_list_page(session, next_page))
+                    next_page += 1
+                if num_page > 0:
+                    json_data = await pending_pages.pop(num_page)
+
+                html_data = json_data['html']
+                post_count = json_data['meta']['postcount']
+                if post_count<=0 or not html_data:
+                    break
 
-        last_article_date = current_date
-        while post_count>0:
-            if parse_to_date:
-                if last_article_date<parse_to_date:
+                links_to_articles, last_article_date = self.process_parse_list_articles(html_data, parse_to_date)
+                # incremental crawling: older pages were collected in previous runs
+                if self._is_known_page(links_to_articles):
+                    self.module_logger.info('[%s] All articles on the page were collected before, stop collecting.'
+                                            % self.site)
+                    complete = False
                     break
+                list_urls.extend(links_to_articles)
 
-            get_query = '&page=%s' % num_page
-            json_data = self.get_page(self.url_list_articles + get_query)
-            json_data = json.loads(json_data)
-            html_data = json_data['html']
-            post_count = json_data['meta']['postcount']
-            if post_count<0 or not html_data:
-                break
-
-            links_to_articles, last_article_date = self.process_parse_list_articles(html_data, parse_to_date)
-            list_urls.extend(links_to_articles)
-            num_page += 1
-
-        # return unique values
-        list_urls = list(set(list_urls))
-        if len(list_urls)!=total_post and not parse_to_date:
+                if parse_to_date:
+                    if last_article_date<parse_to_date:
+                        break
+        finally:
+            for task in pending_pages.values():
+                task.cancel()
+            await asyncio.gather(*pending_pages.values(), return_exceptions=True)
+
+        if len(set(list_urls))!=total_post and not parse_to_date and complete:
             self.module_logger.warning('[%s] The number of collected articles (%s) '
                                   'does not correspond to the expected (%s).'
-                           % (self.site, len(list_urls), total_post))
-        else:
-            self.module_logger.info('On the site %s found %s links to articles%s.'
-                           % (self.site, len(list_urls), message))
+                           % (self.site, len(set(list_urls)), total_post))
         return list_urls
 
     def process_parse_list_articles(self, html_data, parse_to_date=None, *args, **kwargs):
-        soup = BeautifulSoup(html_data, 'lxml')
+        soup = self._make_soup(html_data, self.list_subtrees)
         links_to_articles = []
         last_date = None
 
         for article in soup.find_all('div', {'class': 'newslist__item'}):
             link = article.find('h2', {'class': 'newslist__title'}).find('a').attrs['href']
             last_date = article.find('div', {'class': 'publication__data'}).text
-            last_date = dateparser.parse(last_date,
-                                         settings={'PREFER_DATES_FROM': 'past'},
-                                         date_formats=['%d.%m.%Y %H:%M'])
+            last_date = self.date_parser.parse(last_date, prefer_past=True)
             last_date = last_date.date()
 
             if parse_to_date:
@@ -86,8 +95,8 @@ class ProfileParser(BaseParser):
         return links_to_articles, last_date
 
     def process_parse_page(self, html_data, source_url=None):
-        soup = BeautifulSoup(html_data, 'lxml')
-        json_data = {'content': []}
+        soup = self._make_soup(html_data, self.article_subtrees)
+        content_blocks = []
         article_body = soup.find('div', {'class': 'onenews__body'}).find('div', {'class': 'micromarking'})
 
         announce = soup.find('figure')
@@ -103,25 +112,15 @@ class ProfileParser(BaseParser):
                     title = announce_image.attrs['title']
                 except KeyError:
                     title = ''
-                announce_image = {'image':
-                                      {'source': announce_image.attrs['src'],
-                                       'title': title}}
-                json_data['content'].append(announce_image)
+                content_blocks.append(ContentBlock('image', Image(announce_image.attrs['src'], title)))
 
 
         publication_date = soup.find('div', {'class': 'publication__data'}).find('span', {'class': 'publication__number'})
         publication_date = publication_date.get_text()
-        publication_date = dateparser.parse(publication_date, date_formats=['%d.%m.%Y %H:%M'])
-
-        json_data['publication_date'] = {'year': publication_date.year,
-                                         'month': publication_date.month,
-                                         'day': publication_date.day,
-                                         'hour': publication_date.hour,
-                                         'minute': publication_date.minute}
+        publication_date = self.date_parser.parse(publication_date)
 
         title = soup.find(re.compile("\w"), {'class': 'onenews__title'})
         title = title.get_text()
-        json_data['title'] = title
 
         header_tags = ['h1', 'h2', 'h3', 'h4', 'h5']
         for block in article_body.find_all(re.compile("\w"), recursive=False):
@@ -149,11 +148,10 @@ class ProfileParser(BaseParser):
                     for image in block.find_all('img'):
                         data_type = 'image'
                         try:
-                            title = image.attrs['title']
+                            image_title = image.attrs['title']
                         except KeyError:
-                            title = ''
-                        content = {'source': image.attrs['src'], 'title': title}
-                        json_data['content'].append({data_type: content})
+                            image_title = ''
+                        content_blocks.append(ContentBlock(data_type, Image(image.attrs['src'], image_title)))
                 elif 'onenews' in block['class']:
                     # ads telegram channel or small text
                     continue
@@ -169,5 +167,5 @@ class ProfileParser(BaseParser):
                 self.module_logger.warning('Find unknown data type %s for %s' % (block.name, source_url))
                 continue
 
-            json_data['content'].append({data_type: content})
-        return json_data
+            content_blocks.append(ContentBlock(data_type, content))
+        return Article(source_url, self.site, title, publication_date, content_blocks)
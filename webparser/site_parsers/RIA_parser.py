@@ -1,60 +1,91 @@
 import re
+import asyncio
 from datetime import date, timedelta
 
-from bs4 import BeautifulSoup
-import dateparser
-
 from webparser.base import BaseParser
+from webparser.dates import DateParser
+from webparser.soup import class_xpath
+from webparser.models import Article, ContentBlock, Image, Table
 
 
 class RIA_Parser(BaseParser):
     site = 'ria.ru'
     # TODO Possible problem: if all the news on the page is dated one day, can't get pages for previous dates
+    #  of the date shard
     url_list_articles = 'https://ria.ru/services/tag_rastenija/more.html?date='
+    date_parser = DateParser(['%H:%M %d.%m.%Y'])
+    # listing endpoint is almost all list items, parsing the subtrees again costs more than it saves
+    list_subtrees = None
+    article_subtrees = (class_xpath('article__header', 'div'), class_xpath('article__body', 'div'))
+
+    # Length of a date shard for collecting links, None means to walk all dates in one chain
+    shard_days = 30
+
+    #  The time window is split into date shards, chains of pages of all shards are requested concurrently.
+    #  Inside a shard pages are requested one by one, because every request depends on the previous one.
+    #  If all the news on a page is dated one day, only the rest of the shard is lost, not all older dates.
+    async def _collect_list_urls(self, session, parse_to_date=None):
+        list_urls = []
+        shard_end = date.today()
+        if not self.shard_days:
+            return await self._collect_shard_urls(session, shard_end, parse_to_date)
+
+        while True:
+            shards = []
+            # the whole window or, if archive range is unknown, next max_concurrency shards
+            while len(shards) < self._max_concurrency or parse_to_date:
+                shard_start = shard_end - timedelta(days=self.shard_days - 1)
+                if parse_to_date and shard_start <= parse_to_date:
+                    shards.append((parse_to_date, shard_end))
+                    break
+                shards.append((shard_start, shard_end))
+                shard_end = shard_start - timedelta(days=1)
+
+            shard_urls = await asyncio.gather(*[self._collect_shard_urls(session, end, start)
+                                                for start, end in shards])
+            for urls in shard_urls:
+                list_urls.extend(urls)
+            if parse_to_date or not any(shard_urls):
+                break
+        return list_urls
 
-    #  Getting all links to articles works in sync mode, which slows down the parsing speed,
-    #  but on the other hand, does not load the site with requests, which reduces the likelihood of blocking
-    def collect_list_urls(self, parse_for_days=-1):
-        self.module_logger.info('Start collecting all articles urls from %s.'
-                           % (self.site))
+    async def _collect_shard_urls(self, session, shard_end, shard_start=None):
+        """ Collects links to articles published from shard_start to shard_end (inclusive) """
         list_urls = []
-        current_date = date.today()
-        if parse_for_days>=0:
-            parse_to_date = current_date - timedelta(parse_for_days)
-            message = ' for last %s days' % parse_for_days
-        else:
-            parse_to_date = None
-            message = ''
-
-        last_article_date = current_date
+        last_article_date = shard_end
         penult_article_date = last_article_date + timedelta(days=1)
         while last_article_date != penult_article_date:
-            if parse_to_date:
-                if last_article_date<parse_to_date:
+            if shard_start:
+                if last_article_date<shard_start:
                     break
             penult_article_date = last_article_date
 
             get_query = str(last_article_date).replace('-', '')
-            html_data = self.get_page(self.url_list_articles+get_query)
-            links_to_articles, last_article_date = self.process_parse_list_articles(html_data, parse_to_date)
+            html_data = await self._get_page(self.url_list_articles+get_query, session)
+            links_to_articles, last_article_date = self.process_parse_list_articles(html_data, shard_start)
+            # incremental crawling: older pages were collected in previous runs
+            if self._is_known_page(links_to_articles):
+                self.module_logger.info('[%s] All articles on the page were collected before, stop collecting '
+                                        'shard %s - %s.' % (self.site, shard_start, shard_end))
+                break
             list_urls.extend(links_to_articles)
+            if last_article_date is None:
+                break
 
-        # return unique values
-        list_urls = list(set(list_urls))
-        self.module_logger.info('On the site %s found %s links to articles%s.'
-                           % (self.site, len(list_urls), message))
+        if last_article_date == penult_article_date:
+            self.module_logger.info('[%s] Date of articles stopped at %s, stop collecting shard %s - %s.'
+                                    % (self.site, last_article_date, shard_start, shard_end))
         return list_urls
 
     def process_parse_list_articles(self, html_data, parse_to_date=None, *args, **kwargs):
-        soup = BeautifulSoup(html_data, 'lxml')
+        soup = self._make_soup(html_data, self.list_subtrees)
         links_to_articles = []
         last_date = None
 
         for article in soup.find_all('div', {'class': 'list-item'}):
             link = article.find('a', {'class': 'list-item__title'}).attrs['href']
             last_date = article.find('div', {'class': 'list-item__date'}).text
-            last_date = dateparser.parse(last_date,
-                                         settings={'PREFER_DATES_FROM': 'past'})
+            last_date = self.date_parser.parse(last_date, prefer_past=True)
             last_date = last_date.date()
 
             if parse_to_date:
@@ -65,8 +96,8 @@ class RIA_Parser(BaseParser):
         return links_to_articles, last_date
 
     def process_parse_page(self, html_data, source_url=None):
-        soup = BeautifulSoup(html_data, 'lxml')
-        json_data = {'content': []}
+        soup = self._make_soup(html_data, self.article_subtrees)
+        content_blocks = []
         article_header = soup.find('div', {'class': 'article__header'})
         article_body = soup.find('div', {'class': 'article__body'})
 
@@ -80,25 +111,16 @@ class RIA_Parser(BaseParser):
 
             announce_image = announce.find('img')
             if announce_image:
-                announce_image = {'image':
-                                      {'source': announce_image.attrs['src'],
-                                       'title': announce_image.attrs['title']}}
-                json_data['content'].append(announce_image)
+                announce_image = Image(announce_image.attrs['src'], announce_image.attrs['title'])
+                content_blocks.append(ContentBlock('image', announce_image))
 
 
         publication_date = article_header.find('div', {'class': 'article__info-date'}).find('a')
         publication_date = publication_date.get_text()
-        publication_date = dateparser.parse(publication_date, date_formats=['%H:%M %d.%m.%Y'])
-
-        json_data['publication_date'] = {'year': publication_date.year,
-                                         'month': publication_date.month,
-                                         'day': publication_date.day,
-                                         'hour': publication_date.hour,
-                                         'minute': publication_date.minute}
+        publication_date = self.date_parser.parse(publication_date)
 
         title = article_header.find(re.compile("\w"), {'class': 'article__title'})
         title = title.get_text()
-        json_data['title'] = title
 
         ignored_types = ['article', 'banner', 'social', 'audio']
         header_tags = ['h1', 'h2', 'h3', 'h4', 'h5']
@@ -148,7 +170,7 @@ class RIA_Parser(BaseParser):
                         self.module_logger.warning('Don\'t find src attr for image "%s" for %s'
                                               % (image.attrs['title'], source_url))
 
-                content = {'source': src, 'title': image.attrs['title']}
+                content = Image(src, image.attrs['title'])
 
             elif data_type == 'quote':
                 content = block.get_text()
@@ -156,46 +178,45 @@ class RIA_Parser(BaseParser):
             elif data_type == 'table':
                 head = block.find('table').find('thead')
                 table_body = block.find('table').find_all('tr')
-                content = {'head': [], 'body': []}
+                content = Table([], [])
 
                 for row in head.find_all('tr'):
                     for column in row.find_all('td'):
-                        content['head'].append(column.get_text())
+                        content.head.append(column.get_text())
 
                 for row in table_body:
                     table_row = []
                     for column in row.find_all('td'):
                         table_row.append(column.get_text())
-                    if table_row == content['head']:
+                    if table_row == content.head:
                         continue
-                    content['body'].append(table_row)
+                    content.body.append(table_row)
 
             elif data_type == 'infographics':
                 image = block.find('img')
                 if not image:
                     continue
                 data_type = 'image'
-                content = {'source': image.attrs['src'], 'title': image.attrs['title']}
+                content = Image(image.attrs['src'], image.attrs['title'])
 
             elif data_type == 'photolenta':
                 for item in block.find_all('div', {'class': 'article__photo-item'}):
                     image = item.find('div', {'class': 'article__photo-item-image'}).find('img')
-                    content = {'source': image.attrs['src'], 'title': image.attrs['title']}
-                    json_data['content'].append({'image': content})
+                    content_blocks.append(ContentBlock('image', Image(image.attrs['src'], image.attrs['title'])))
 
                     item = item.find('div', {'class': 'article__photo-inner-desc'})\
                         .find('div', {'class': 'article__photo-item-text'})
 
                     for paragraph in item.find_all('p'):
                         text_content = paragraph.get_text()
-                        json_data['content'].append({'text': text_content})
+                        content_blocks.append(ContentBlock('text', text_content))
 
                 continue
 
             elif data_type == 'recipe':
-                title = block.find('div', {'class': 'article__recipe-title'})
-                if title:
-                    json_data['content'].append({'h3': title.get_text()})
+                recipe_title = block.find('div', {'class': 'article__recipe-title'})
+                if recipe_title:
+                    content_blocks.append(ContentBlock('h3', recipe_title.get_text()))
 
                 text_content = block.find('div', {'class': 'article__recipe-desc'})
                 if text_content:
@@ -210,18 +231,18 @@ class RIA_Parser(BaseParser):
                         detail_value = item.find('div', {'class': 'article__recipe-details-value'}).get_text()
                         text_content += f'\n{detail_title}: {detail_value}'
                 if text_content:
-                    json_data['content'].append({'text': text_content})
+                    content_blocks.append(ContentBlock('text', text_content))
 
                 subtitle = block.find('div', {'class': 'article__recipe-subtitle'})
                 if subtitle:
-                    json_data['content'].append({'h3': subtitle.get_text()})
+                    content_blocks.append(ContentBlock('h3', subtitle.get_text()))
 
                 instructions = block.find('div', {'class': 'article__recipe-instruction'})
                 if instructions:
                     content = []
                     for elem in instructions.find_all('div', {'class': 'article__recipe-instruction-text'}):
                         content.append(elem.get_text())
-                    json_data['content'].append({'list': content})
+                    content_blocks.append(ContentBlock('list', content))
 
                 continue
 
@@ -230,5 +251,5 @@ class RIA_Parser(BaseParser):
                 self.module_logger.warning('Find unknown data type %s for %s' % (data_type, source_url))
                 continue
 
-            json_data['content'].append({data_type: content})
-        return json_data
\ No newline at end of file
+            content_blocks.append(ContentBlock(data_type, content))
+        return Article(source_url, self.site, title, publication_date, content_blocks)
\ No newline at end of file
@@ -0,0 +1,120 @@
+import logging
+import os
+import tempfile
+import unittest
+
+from webparser.base import BaseParser
+from webparser.checkpoint import Checkpoint
+from webparser.index import SeenIndex
+from webparser.orchestrator import Orchestrator
+
+
+URLS = ['https://example.com/%s' % i for i in range(30)]
+
+
+class FakeParser(BaseParser):
+    site = 'example.com'
+
+    async def _collect_list_urls(self, session, parse_to_date=None):
+        return list(URLS)
+
+    async def _get_page(self, url, session=None):
+        return '<html>%s</html>' % url
+
+    def process_parse_page(self, html_data, source_url=None):
+        return {'title': source_url}
+
+
+class ListSink():
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.urls = []
+
+    def write(self, url, json_data):
+        if self.fail_after is not None and len(self.urls) == self.fail_after:
+            raise RuntimeError('sink failed')
+        self.urls.append(url)
+
+
+class CheckpointResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.checkpoint = Checkpoint(os.path.join(self.directory.name, 'checkpoint.sqlite'))
+        self.seen_index = SeenIndex(os.path.join(self.directory.name, 'index.sqlite'))
+
+    def tearDown(self):
+        self.checkpoint.close()
+        self.seen_index.close()
+        self.directory.cleanup()
+
+    def make_parser(self, **kwargs):
+        kwargs.setdefault('checkpoint', self.checkpoint)
+        return FakeParser({}, 'critical', 0, 3, logging.NullHandler(), **kwargs)
+
+    def assert_resumed(self, failed_sink, sink):
+        self.assertEqual(set(failed_sink.urls + sink.urls), set(URLS))
+        self.assertFalse(set(failed_sink.urls) & set(sink.urls))
+
+    def resume_with_seen_index(self, checkpoint):
+        failed_sink = ListSink(fail_after=5)
+        with self.make_parser(checkpoint=checkpoint, seen_index=self.seen_index) as parser:
+            with self.assertRaises(RuntimeError):
+                parser.parse_to(URLS, failed_sink)
+        sink = ListSink()
+        with self.make_parser(checkpoint=checkpoint, seen_index=self.seen_index) as parser:
+            parser.parse_to(URLS, sink)
+        self.assert_resumed(failed_sink, sink)
+
+    def test_pages_not_written_by_failed_sink_are_not_seen(self):
+        self.resume_with_seen_index(None)
+
+    def test_resume_with_seen_index_and_checkpoint(self):
+        self.resume_with_seen_index(self.checkpoint)
+
+    def test_crawl_resumes_pages_not_written_by_failed_sink(self):
+        failed_sink = ListSink(fail_after=5)
+        with self.assertRaises(RuntimeError):
+            Orchestrator([self.make_parser(seen_index=self.seen_index)]).crawl(0, failed_sink)
+        sink = ListSink()
+        Orchestrator([self.make_parser(seen_index=self.seen_index)]).crawl(0, sink)
+        # pages saved in checkpoint are given again by the resumed crawl
+        self.assertEqual(set(failed_sink.urls + sink.urls), set(URLS))
+
+    def test_pages_not_written_by_failed_sink_are_parsed_after_resume(self):
+        failed_sink = ListSink(fail_after=5)
+        with self.make_parser() as parser:
+            with self.assertRaises(RuntimeError):
+                parser.parse_to(URLS, failed_sink, skip_seen=False)
+        sink = ListSink()
+        with self.make_parser() as parser:
+            parser.parse_to(URLS, sink, skip_seen=False)
+        self.assert_resumed(failed_sink, sink)
+
+    def resume_with_seen_index(self, checkpoint):
+        failed_sink = ListSink(fail_after=5)
+        with self.make_parser(checkpoint=checkpoint, seen_index=self.seen_index) as parser:
+            with self.assertRaises(RuntimeError):
+                parser.parse_to(URLS, failed_sink)
+        sink = ListSink()
+        with self.make_parser(checkpoint=checkpoint, seen_index=self.seen_index) as parser:
+            parser.parse_to(URLS, sink)
+        self.assert_resumed(failed_sink, sink)
+
+    def test_pages_not_written_by_failed_sink_are_not_seen(self):
+        self.resume_with_seen_index(None)
+
+    def test_resume_with_seen_index_and_checkpoint(self):
+        self.resume_with_seen_index(self.checkpoint)
+
+    def test_crawl_resumes_pages_not_written_by_failed_sink(self):
+        failed_sink = ListSink(fail_after=5)
+        with self.assertRaises(RuntimeError):
+            Orchestrator([self.make_parser(seen_index=self.seen_index)]).crawl(0, failed_sink)
+        sink = ListSink()
+        Orchestrator([self.make_parser(seen_index=self.seen_index)]).crawl(0, sink)
+        # pages saved in checkpoint are given again by the resumed crawl
+        self.assertEqual(set(failed_sink.urls + sink.urls), set(URLS))
+
+
+if __name__ == '__main__':
+    unittest.main()
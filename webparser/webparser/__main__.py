@@ -0,0 +1,4 @@
+from webparser.cli import main
+
+
+main()
@@ -1,14 +1,26 @@
 import logging
-import requests
 from requests.exceptions import RequestException, HTTPError, ConnectionError, Timeout
 
-from time import sleep
-from datetime import datetime
+from datetime import date, timedelta
 import random
+import time
+import weakref
+
+from webparser.scheduler import HostScheduler, parse_retry_after
+from webparser.cache import HTTPCache
+from webparser.retry import RetryPolicy, CircuitBreakers
+from webparser.metrics import ParseMetrics
+from webparser.pool import ConnectionPool
+from webparser.budget import ByteBudget
+from webparser.page import RawPage, content_charset, ACCEPT_ENCODING
+from webparser.models import Article
 
 import asyncio
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 import aiohttp
-from aiohttp.client_exceptions import ClientConnectorError, ClientResponseError
+from aiohttp.client_exceptions import ClientConnectionError, ClientResponseError
 from asyncio.exceptions import TimeoutError
 
 # https://github.com/aio-libs/aiohttp/issues/6635
@@ -28,42 +40,164 @@ def silence_event_loop_closed(func):
 _ProactorBasePipeTransport.__del__ = silence_event_loop_closed(_ProactorBasePipeTransport.__del__)
 
 
+# Parser instance of the parse worker process, it's set once by the pool initializer
+_worker_parser = None
+
+def _init_parse_worker(parser):
+    global _worker_parser
+    _worker_parser = parser
+
+def _process_page_in_worker(html_data, source_url):
+    return _worker_parser._extract(html_data, source_url)
+
+
+def connect_trace_config():
+    """
+     Measures time of opening new connections into ParseMetrics of the parser,
+     the url and the metrics are passed in trace_request_ctx of the request
+    """
+    async def on_connection_create_start(session, context, params):
+        context.connect_started = time.perf_counter()
+
+    async def on_connection_create_end(session, context, params):
+        if context.trace_request_ctx:
+            context.trace_request_ctx['metrics'].observe(context.trace_request_ctx['url'], 'connect',
+                                                         time.perf_counter() - context.connect_started)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return trace_config
+
+
+async def _anext(async_iterator):
+    # run_coroutine_threadsafe accepts only coroutines
+    return await async_iterator.__anext__()
+
+
 class RequestFailed(Exception):
-    def __init__(self, message, url):
+    """
+     reason classifies the failure: 'timeout', 'connection', 'too_many_requests', 'server_error',
+     'client_error', 'circuit_open' or 'other'
+    """
+    def __init__(self, message, url, status_code=None, retry_after=None, reason='other'):
         self.url = url
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
         self.message = 'Request failed for %s. %s' \
                   % (url, message)
         super().__init__(self.message)
 
 
+class CircuitOpen(RequestFailed):
+    def __init__(self, url, retry_in):
+        super().__init__('Host is not available, circuit is open for %.1f sec more.' % retry_in, url,
+                         reason='circuit_open')
+
+
 class ReturnNotHTML(Exception):
     def __init__(self, url, html_data):
         self.url = url
         self.message = 'Request returned non-html data. Url: %s. Type data: %s' \
-                       % url, type(html_data)
+                       % (url, type(html_data))
         super().__init__(self.message)
 
 
-# TODO return links that could not be parsed
-#   fake user agent, proxy
+# TODO fake user agent, proxy
 #   read from file
-#   add async mode with _get_page problem
 class BaseParser():
     site = None
     url_list_articles = None
     headers = None
+    # XPath expressions of the parts of pages used by process_parse_list_articles and process_parse_page,
+    # only they are parsed by BeautifulSoup. None means the whole page
+    list_subtrees = None
+    article_subtrees = None
+    # format of publication_date in dicts made of articles: 'parts' or 'str', see Article.to_dict
+    publication_date_format = 'parts'
 
     _json_list_pages = None
+    _executor = None
+    # time of building soup during the current process_parse_page call
+    _soup_seconds = 0
+    # soups built during the current process_parse_page call, they are decomposed after it
+    _soups = None
+    # attributes which live only in the main process and are not sent to parse workers
+    _runtime_state = ('_scheduler', '_executor', '_cache', '_seen_index', '_breakers',
+                      '_dead_letters', '_checkpoint', 'metrics', '_pool', '_duplicates')
 
-    def __init__(self, headers, verbosity='warning', pause_between_requests=1, timeout=3, *log_handlers):
+    def __init__(self, headers, verbosity='warning', pause_between_requests=1, timeout=3, *log_handlers,
+                 max_concurrency=10, requests_per_second=None, max_in_flight_per_host=None, host_limits=None,
+                 adaptive_limits=True, parse_workers=0, cache=None, seen_index=None, retry_policy=None,
+                 circuit_breakers=None, dead_letters=None, checkpoint=None, metrics_path=None,
+                 metrics_format='json', metrics_per_url=False, profiler=None, pool=None, pool_size=None, pool_size_per_host=0,
+                 keepalive_timeout=30, dns_cache_ttl=300, parse_queue_size=None, result_queue_size=None,
+                 max_inflight_bytes=None, raw_pages=False, articles=False, duplicates=None, drop_duplicates=False):
         self.headers = headers
         self._time_out = timeout
         self._pause_between_requests = pause_between_requests
+        # how many pages can be fetched at the same time in async mode
+        self._max_concurrency = max_concurrency
+        # politeness is applied per host, pause_between_requests is kept as the default rate
+        if requests_per_second is None and pause_between_requests:
+            requests_per_second = 1 / pause_between_requests
+        self._scheduler = HostScheduler(rate=requests_per_second,
+                                        max_in_flight=max_in_flight_per_host or max_concurrency,
+                                        host_limits=host_limits, adaptive=adaptive_limits)
+        # connections are kept between requests and calls until close, pool can be shared with other parsers
+        self._own_pool = pool is None
+        if pool is None:
+            pool = ConnectionPool(pool_size or max_concurrency, pool_size_per_host, keepalive_timeout, dns_cache_ttl,
+                                  headers=headers, timeout=aiohttp.ClientTimeout(total=timeout),
+                                  trace_configs=[connect_trace_config()])
+            # own pool is closed with the parser if close wasn't called
+            weakref.finalize(self, pool.close)
+        self._pool = pool
+        # fetched pages wait for parsing in parse queue, parsed ones wait for the consumer in result queue,
+        # fetching stops while the queues are full or the size of fetched and not parsed pages is over the budget
+        self._parse_queue_size = parse_queue_size or max_concurrency
+        self._result_queue_size = result_queue_size or max_concurrency
+        self._max_inflight_bytes = max_inflight_bytes
+        # results are Article objects, otherwise (by default) dicts made of them as before
+        self._articles = articles
+        # pages are passed to parser as RawPage bytes and decoded by lxml, otherwise as str decoded from utf-8
+        self._raw_pages = raw_pages
+        # number of processes for process_parse_page, 0 means parse in the event loop thread
+        self._parse_workers = parse_workers
+        # optional HTTPCache, shared by get_page and _get_page
+        self._cache = cache
+        # optional SeenIndex of already collected articles for incremental crawling
+        self._seen_index = seen_index
+        # transient failures are repeated, hosts which are down fail fast
+        self._retry_policy = retry_policy or RetryPolicy()
+        self._breakers = circuit_breakers or CircuitBreakers()
+        # optional DeadLetterStore for urls which could not be parsed
+        self._dead_letters = dead_letters
+        # optional Checkpoint to resume interrupted collect_list_urls and parse
+        self._checkpoint = checkpoint
+        # timings of phases of pages, they are reset at the start of every run and dumped at its end
+        # to metrics_path with .collect suffix for collect_list_urls and .parse for parse
+        self.metrics = ParseMetrics(self.site, metrics_per_url)
+        self._metrics_path = metrics_path
+        self._metrics_format = metrics_format
+        # optional PageProfiler of process_parse_page, report is written at the end of parse
+        self.profiler = profiler
+        # optional DuplicateIndex, near-duplicates of known articles are dropped or get duplicate_of
+        self._duplicates = duplicates
+        self._drop_duplicates = drop_duplicates
 
         self.module_logger = logging.getLogger(self.__class__.__name__)
         self.module_logger.setLevel(logging.DEBUG)
         self._setup_loggers(verbosity, *log_handlers)
 
+    def __getstate__(self):
+        """ Parser is sent to parse worker processes without its runtime state """
+        state = self.__dict__.copy()
+        for name in self._runtime_state:
+            state.pop(name, None)
+        return state
+
     def _setup_loggers(self, verbosity, *log_handlers):
         console_log_level = getattr(logging, verbosity.upper())
         console_format = logging.Formatter('%(levelname)s: %(message)s')
@@ -82,57 +216,358 @@ class BaseParser():
             file_handler.setFormatter(file_format)
             self.module_logger.addHandler(file_handler)
 
-    async def _parse_list_pages(self, list_urls):
+    async def _parse_list_pages(self, list_urls, skip_seen=True):
         """ For a given list of urls, return parsed data for each of the pages """
-        self.module_logger.info('[%s] Started parsing pages from the list of urls.' % self.__class__.__name__)
-        self.parse_info = {'num_pages': len(list_urls), 'processed': 0, 'collected': 0, 'skipped': 0}
-        with requests.Session() as session:
-            json_page_data_list = await asyncio.gather(*[self._parse_page(links, session)
-                                                         for links in list_urls])
-
-        json_data = {}
-        for (links, json_page_data) in zip(list_urls, json_page_data_list):
-            if isinstance(json_page_data, dict):
-                json_data[links] = json_page_data
+        json_data = self._resumed_pages(list_urls)
+        async for url, json_page_data in self.aiter_parse(list_urls, skip_seen):
+            json_data[url] = json_page_data
         self._json_list_pages = json_data
+
+    def _resumed_pages(self, list_urls):
+        """ Parsed pages from the given urls which were saved in checkpoint by the interrupted run """
+        if not self._checkpoint:
+            return {}
+        done_pages = self._checkpoint.done_pages(self.site)
+        return {url: self._from_checkpoint(done_pages[url]) for url in list_urls if done_pages.get(url) is not None}
+
+    async def aiter_parse(self, list_urls, skip_seen=True, session=None):
+        """
+         Async iterator over (url, page_content) of successfully parsed pages, which yields pages as soon
+         as they are ready. Pages go through bounded stages: max_concurrency fetch workers -> parse queue ->
+         parsers (parse_workers processes or one in the loop) -> result queue -> the caller.
+         Only pages in the stages are kept in memory, so it doesn't depend on the number of urls.
+         session is aiohttp session shared with other parsers, by default the parser opens its own one.
+        """
+        if skip_seen:
+            list_urls = self._filter_seen(list_urls)
+        else:
+            list_urls = list(list_urls)
+        if self._checkpoint:
+            done_urls = self._checkpoint.done_urls(self.site)
+            if done_urls:
+                self.module_logger.info('[%s] Resume from checkpoint, %s pages are already processed.'
+                                        % (self.__class__.__name__, len(done_urls)))
+                list_urls = [url for url in list_urls if url not in done_urls]
+        random.shuffle(list_urls)
+
+        self.module_logger.info('[%s] Started parsing pages from the list of urls.' % self.__class__.__name__)
+        self.metrics.reset()
+        self.parse_info = {'num_pages': len(list_urls), 'processed': 0, 'collected': 0, 'skipped': 0, 'failed': 0,
+                           'duplicates': 0}
+        if self._parse_workers:
+            # the loop runs in the thread of the pool and the process has other threads, fork could deadlock
+            self._executor = ProcessPoolExecutor(max_workers=self._parse_workers, mp_context=get_context('spawn'),
+                                                 initializer=_init_parse_worker, initargs=(self,))
+        parse_queue = asyncio.Queue(maxsize=self._parse_queue_size)
+        # parsers put parsed pages here, they wait while the consumer is behind
+        results = asyncio.Queue(maxsize=self._result_queue_size)
+        budget = ByteBudget(self._max_inflight_bytes)
+        # process_parse_page blocks the loop, more than one parser makes sense only with worker processes
+        num_parsers = self._parse_workers or 1
+        urls = iter(list_urls)
+        tasks = []
+        try:
+            async with self._session(session) as session:
+                tasks = [asyncio.create_task(self._fetch_stage(urls, session, parse_queue, budget, results,
+                                                               num_parsers))]
+                tasks.extend(asyncio.create_task(self._parse_stage(parse_queue, budget, results))
+                             for _ in range(num_parsers))
+                finished_parsers = 0
+                while finished_parsers < num_parsers:
+                    result = await results.get()
+                    if result is None:
+                        finished_parsers += 1
+                    elif isinstance(result, BaseException):
+                        raise result
+                    else:
+                        yield result
+                        # the consumer has handled the page, next and resumed runs don't parse it again
+                        url, json_data = result
+                        self._remember_article(url, json_data)
+                        if self._checkpoint:
+                            self._checkpoint.page_done(self.site, url, self._to_checkpoint(json_data))
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.parse_info['peak_inflight_bytes'] = budget.peak
+            if self._executor:
+                self._executor.shutdown()
+                self._executor = None
+            if self._checkpoint:
+                self._checkpoint.flush()
+
+        # the job is finished, next run starts from scratch
+        if self._checkpoint:
+            self._checkpoint.clear(self.site)
+        self._dump_reports()
         self.module_logger.info('[%s] Finished parsing pages from the list of urls. Successfully collected '
                            '%s pages out of %s (%s skipped).'
                            % (self.__class__.__name__, self.parse_info['collected'],
                               self.parse_info['num_pages'], self.parse_info['skipped']))
 
-    async def _parse_page(self, url, session):
-        pause = self._pause_between_requests + random.random() / 5 if self._pause_between_requests else 0
-        # FIXME what's the point in async parsing if we need have pause between requests?
-        sleep(pause)
+    async def _fetch_stage(self, urls, session, parse_queue, budget, results, num_parsers):
+        """ Fetch pages by max_concurrency workers, None for every parser in parse queue means finish """
+        try:
+            await asyncio.gather(*[self._fetch_worker(urls, session, parse_queue, budget)
+                                   for _ in range(self._max_concurrency)])
+        except asyncio.CancelledError:
+            raise
+        except BaseException as ex:
+            # KeyboardInterrupt too, the loop of the pool goes on and the consumer must not wait forever
+            await results.put(ex)
+        else:
+            for _ in range(num_parsers):
+                await parse_queue.put(None)
+
+    async def _fetch_worker(self, urls, session, parse_queue, budget):
+        """ Take urls one by one from the shared iterator until it's exhausted """
+        for url in urls:
+            html_data = await self._fetch_for_parse(url, session)
+            if html_data is not None:
+                await budget.acquire(len(html_data))
+                await parse_queue.put((url, html_data))
 
+    async def _parse_stage(self, parse_queue, budget, results):
+        """ Parse fetched pages until None comes from parse queue, None in results means finish """
         try:
-            html_data = self.get_page(url, session)
-            if not isinstance(html_data, str):
+            while True:
+                page = await parse_queue.get()
+                if page is None:
+                    break
+                url, html_data = page
+                try:
+                    json_data = await self._handle_page(url, html_data)
+                finally:
+                    budget.release(len(html_data))
+                # the page must not live until the next one comes
+                page = html_data = None
+                if isinstance(json_data, (dict, Article)):
+                    await results.put((url, json_data))
+        except asyncio.CancelledError:
+            raise
+        except BaseException as ex:
+            await results.put(ex)
+        else:
+            await results.put(None)
+
+    def _client_session(self):
+        """ Create aiohttp session for a run in the caller's event loop """
+        connector = aiohttp.TCPConnector(limit=self._pool.size, limit_per_host=self._pool.size_per_host,
+                                         keepalive_timeout=self._pool.keepalive_timeout,
+                                         ttl_dns_cache=self._pool.dns_cache_ttl)
+        return aiohttp.ClientSession(headers=self.headers, connector=connector,
+                                     timeout=aiohttp.ClientTimeout(total=self._time_out),
+                                     trace_configs=[connect_trace_config()])
+
+    @asynccontextmanager
+    async def _session(self, session=None):
+        """
+         The given shared session, the session of the pool if it runs in the loop of the pool,
+         otherwise (aiter_parse in the caller's loop) a new session, which is closed on exit
+        """
+        if session is not None:
+            yield session
+        elif self._pool.in_loop():
+            yield self._pool.async_session()
+        else:
+            async with self._client_session() as session:
+                yield session
+
+    def close(self):
+        """ Close connections of the parser, a pool passed to the parser is left open for the others """
+        if self._own_pool:
+            self._pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _dump_metrics(self, phase):
+        if self._metrics_path:
+            self.metrics.dump('%s.%s' % (self._metrics_path, phase), self._metrics_format)
+
+    def _dump_reports(self):
+        self._dump_metrics('parse')
+        if self.profiler and self.profiler.report_path:
+            self.profiler.dump()
+
+    async def _fetch_for_parse(self, url, session):
+        """ Page content or None if it can't be fetched, failures are logged and saved in dead letters """
+        try:
+            html_data = await self._get_page(url, session)
+            if not isinstance(html_data, (str, bytes)):
                 raise ReturnNotHTML(url, html_data)
         except RequestFailed as ex:
             self.module_logger.error(ex.__str__())
+            retryable = ex.reason == 'circuit_open' or ex.reason in self._retry_policy.retry_on
+            self._add_dead_letter(url, ex.reason, ex.message, ex.status_code, retryable)
+            self._page_processed()
             return None
         except ReturnNotHTML as ex:
             self.module_logger.error(ex.__str__())
+            self._add_dead_letter(url, 'not_html', ex.message)
+            self._page_processed()
             return None
-        else:
-            json_data = self.process_parse_page(html_data, source_url=url)
-            if isinstance(json_data, dict):
-                self.parse_info['collected'] += 1
+        return html_data
+
+    async def _handle_page(self, url, html_data):
+        """
+         Parse fetched page and save the result in dead letters. Skipped pages and dropped duplicates are saved
+         in seen index and checkpoint here, parsed pages are saved by aiter_parse when the consumer has got them
+        """
+        try:
+            try:
+                json_data = await self._process_page(html_data, url)
+            except Exception as ex:
+                self.module_logger.exception('[%s] Failed to parse page %s.' % (self.__class__.__name__, url))
+                self._add_dead_letter(url, 'parse_error', '%s: %s' % (ex.__class__.__name__, ex))
+                return None
+            drop = False
+            if isinstance(json_data, (dict, Article)):
+                drop = self._is_duplicate(url, json_data) and self._drop_duplicates
+                if not drop:
+                    self.parse_info['collected'] += 1
+                if self._dead_letters:
+                    self._dead_letters.remove(self.site, url)
             else:
                 self.parse_info['skipped'] += 1
+                self._add_dead_letter(url, 'skipped', 'process_parse_page skipped the page.')
+            if drop or not isinstance(json_data, (dict, Article)):
+                # dropped duplicates are remembered too, to not fetch them again
+                self._remember_article(url, json_data)
+                if self._checkpoint:
+                    self._checkpoint.page_done(self.site, url)
+                return None
             return json_data
         finally:
-            self.parse_info['processed'] += 1
-            self.module_logger.debug('[%s] Processed pages: %s/%s'
-                                % (self.__class__.__name__, self.parse_info['processed'], self.parse_info['num_pages']))
+            self._page_processed()
 
-    def parse(self, list_urls):
-        """ For a given urls return parsed data in format: {url: page_content} """
-        random.shuffle(list_urls)
-        asyncio.run(self._parse_list_pages(list_urls))
+    def _is_duplicate(self, url, json_data):
+        """ Check the article in the duplicate index, duplicates get url of the original """
+        if not self._duplicates:
+            return False
+        original = self._duplicates.check(self.site, url, json_data)
+        if original is None:
+            return False
+        self.parse_info['duplicates'] += 1
+        self.module_logger.debug('[%s] Page %s is a duplicate of %s.' % (self.__class__.__name__, url, original[1]))
+        if isinstance(json_data, Article):
+            json_data.duplicate_of = original[1]
+        else:
+            json_data['duplicate_of'] = original[1]
+        return True
+
+    @staticmethod
+    def _to_checkpoint(json_data):
+        if isinstance(json_data, Article):
+            return json_data.to_record()
+        return json_data if isinstance(json_data, dict) else None
+
+    @staticmethod
+    def _from_checkpoint(data):
+        # records of articles have url, dicts of process_parse_page don't
+        return Article.from_record(data) if 'url' in data else data
+
+    def _page_processed(self):
+        self.parse_info['processed'] += 1
+        self.parse_info['hosts'] = self._scheduler.stats()
+        self.parse_info['circuits'] = self._breakers.stats()
+        self.module_logger.debug('[%s] Processed pages: %s/%s'
+                                 % (self.__class__.__name__, self.parse_info['processed'],
+                                    self.parse_info['num_pages']))
+
+    def _add_dead_letter(self, url, reason, message='', status_code=None, retryable=False):
+        if reason != 'skipped':
+            self.parse_info['failed'] += 1
+        if self._dead_letters:
+            self._dead_letters.add(self.site, url, reason, message, status_code, retryable)
+
+    async def _process_page(self, html_data, url):
+        """ Run process_parse_page in the worker pool if there is one, so fetching goes on while pages are parsed """
+        if self._executor:
+            loop = asyncio.get_running_loop()
+            json_data, timings, profile = await loop.run_in_executor(self._executor, _process_page_in_worker,
+                                                                     html_data, url)
+            # profilers of workers keep their own tops, the global top is made of them
+            if profile is not None:
+                self.profiler.add(profile)
+        else:
+            json_data, timings, profile = self._extract(html_data, url)
+        for phase, seconds in timings.items():
+            self.metrics.observe(url, phase, seconds)
+        return json_data
+
+    def _extract(self, html_data, url):
+        """
+         Run process_parse_page, return its result, time of building soup and of extraction
+         and the record of PageProfiler if the page was profiled
+        """
+        self._soup_seconds = 0
+        self._soups = []
+        profile = None
+        try:
+            start = time.perf_counter()
+            if self.profiler:
+                json_data, profile = self.profiler.run(url, self.process_parse_page, html_data, source_url=url)
+            else:
+                json_data = self.process_parse_page(html_data, source_url=url)
+            elapsed = time.perf_counter() - start
+            if isinstance(json_data, Article) and not self._articles:
+                json_data = json_data.to_dict(self.publication_date_format)
+        finally:
+            # trees have reference cycles, without decompose they live until the garbage collector comes
+            for soup in self._soups:
+                soup.decompose()
+            self._soups = None
+        return json_data, {'html_parse': self._soup_seconds, 'extraction': elapsed - self._soup_seconds}, profile
+
+    def parse(self, list_urls, skip_seen=True):
+        """
+         For a given urls return parsed data in format: {url: page_content}
+         If parser has seen_index, urls which were collected before are skipped unless skip_seen=False.
+        """
+        self._pool.run(self._parse_list_pages(list_urls, skip_seen))
         return self._json_list_pages
 
+    def replay(self, reasons=None):
+        """
+         Parse again urls from the dead letter store: retryable ones or, if reasons are given,
+         urls failed with these reasons (['parse_error'] after a fix of the parser for example).
+         Successfully parsed urls are removed from the store.
+        """
+        if not self._dead_letters:
+            raise ValueError('Parser has no dead letter store')
+        list_urls = self._dead_letters.urls(self.site, reasons)
+        self.module_logger.info('[%s] Replay %s failed urls.' % (self.__class__.__name__, len(list_urls)))
+        return self.parse(list_urls, skip_seen=False)
+
+    def iter_parse(self, list_urls, skip_seen=True):
+        """
+         Sync version of aiter_parse. The event loop of the parser runs in a separate thread,
+         so requests in work don't stop while the caller handles results.
+        """
+        results = self.aiter_parse(list_urls, skip_seen)
+        try:
+            while True:
+                try:
+                    # on KeyboardInterrupt the pending __anext__ is cancelled and finished before aclose
+                    yield self._pool.run(_anext(results))
+                except StopAsyncIteration:
+                    break
+        finally:
+            self._pool.run(results.aclose())
+
+    def parse_to(self, list_urls, sink, skip_seen=True):
+        """ Write parsed pages to the sink (JSONLinesSink for example) as soon as they are ready """
+        for url, json_data in self.iter_parse(list_urls, skip_seen):
+            with self.metrics.timer(url, 'serialization'):
+                sink.write(url, json_data)
+        self._dump_reports()
+        return self.parse_info
+
     def collect_list_urls(self, parse_for_days=-1):
         """
          Finds all links to articles on site and returns them.
@@ -140,62 +575,278 @@ class BaseParser():
          parse_for_days<0 means parse all data from site
          parse_for_days=0 means to parse the data for the current day
         """
+        return self._pool.run(self.acollect_list_urls(parse_for_days))
+
+    async def acollect_list_urls(self, parse_for_days=-1, session=None):
+        """ Async version of collect_list_urls, session is aiohttp session shared with other parsers """
+        self.metrics.reset()
+        self.module_logger.info('Start collecting all articles urls from %s.'
+                           % (self.site))
+        current_date = date.today()
+        if parse_for_days>=0:
+            parse_to_date = current_date - timedelta(parse_for_days)
+            message = ' for last %s days' % parse_for_days
+        else:
+            parse_to_date = None
+            message = ''
+
+        if self._checkpoint:
+            list_urls = self._checkpoint.discovery(self.site, parse_for_days)
+            if list_urls is not None:
+                self.module_logger.info('On the site %s found %s links to articles%s (from checkpoint).'
+                                        % (self.site, len(list_urls), message))
+                return list_urls
+
+        async with self._session(session) as session:
+            list_urls = await self._collect_list_urls(session, parse_to_date)
+
+        # return unique values
+        list_urls = list(set(list_urls))
+        if self._checkpoint:
+            self._checkpoint.save_discovery(self.site, parse_for_days, list_urls)
+        self._dump_metrics('collect')
+        self.module_logger.info('On the site %s found %s links to articles%s.'
+                           % (self.site, len(list_urls), message))
+        return list_urls
+
+    async def _collect_list_urls(self, session, parse_to_date=None):
+        """
+         Finds links to articles published not earlier than parse_to_date (all articles if it's None).
+         Requests must be made with _get_page and the given session.
+        """
         raise NotImplementedError('Subclasses must implement this method')
 
+    def _filter_seen(self, list_urls):
+        if not self._seen_index:
+            return list(list_urls)
+        known_urls = self._seen_index.known(self.site, list_urls)
+        if known_urls:
+            self.module_logger.info('[%s] Skip %s already collected articles.'
+                                    % (self.__class__.__name__, len(known_urls)))
+        return [url for url in list_urls if url not in known_urls]
+
+    def _is_known_page(self, links_to_articles):
+        """ True if all articles from the page of the list of articles were collected before """
+        if not self._seen_index or not links_to_articles:
+            return False
+        return len(self._seen_index.known(self.site, links_to_articles)) == len(set(links_to_articles))
+
+    def _remember_article(self, url, json_data):
+        """ Add processed article to the seen index, skipped articles are added too, to not fetch them again """
+        if not self._seen_index:
+            return
+        if isinstance(json_data, Article):
+            published = json_data.published.strftime('%Y-%m-%d %H:%M')
+        else:
+            published = json_data.get('publication_date') if isinstance(json_data, dict) else None
+        if isinstance(published, dict):
+            published = '%04d-%02d-%02d %02d:%02d' % (published['year'], published['month'], published['day'],
+                                                      published['hour'], published['minute'])
+        self._seen_index.add(self.site, url, published)
+
+    def url_kind(self, url):
+        """ Kind of the url for the cache: 'listing' for pages with links to articles, 'article' for others """
+        if self.url_list_articles and url.startswith(self.url_list_articles):
+            return 'listing'
+        return 'article'
+
+    def _cached_page(self, url):
+        return self._cache.get(url, self.url_kind(url)) if self._cache else None
+
+    def _request_headers(self, cached=None):
+        """ Headers of the parser with validators of the cached page and compression the clients can decode """
+        headers = HTTPCache.conditional_headers(cached, self.headers)
+        headers.setdefault('Accept-Encoding', ACCEPT_ENCODING)
+        return headers
+
+    def _page_content(self, url, body, response_headers):
+        """ RawPage with charset of the response or page decoded from utf-8, the cache keeps decoded pages """
+        if self._raw_pages:
+            page = RawPage(body, content_charset(response_headers.get('Content-Type')) or 'utf-8')
+            if self._cache:
+                self._store_page(url, page.decode(errors='replace'), response_headers)
+        else:
+            page = body.decode('utf-8', errors='replace')
+            self._store_page(url, page, response_headers)
+        return page
+
+    def _store_page(self, url, response_text, response_headers):
+        if self._cache:
+            self._cache.store(url, response_text, response_headers.get('ETag'), response_headers.get('Last-Modified'))
+
+    def _make_soup(self, html_data, subtrees=None):
+        # bs4 and lxml are imported with the first page, fetching doesn't need them
+        from webparser.soup import make_soup
+
+        start = time.perf_counter()
+        soup = make_soup(html_data, subtrees)
+        self._soup_seconds += time.perf_counter() - start
+        if self._soups is not None:
+            self._soups.append(soup)
+        return soup
+
     def process_parse_list_articles(self, html_data, *args, **kwargs):
         """ For a given html page, finds all links to articles in it and returns a list of urls """
         raise NotImplementedError('Subclasses must implement this method')
 
     def process_parse_page(self, html_data, source_url=None):
         """
-         For a given html page return parsed data in json.
+         For a given html page return parsed article as Article (or dict), None to skip the page.
          Source urls optional and needs only for logging.
         """
         raise NotImplementedError('Subclasses must implement this method')
 
-    # FIXME during async parsing, the site blocks access, the reason is unknown
+    def _http_error(self, limiter, url, status_code, headers):
+        """ Report status code to the host limiter and return exception for it """
+        retry_after = parse_retry_after(headers.get('Retry-After')) if headers else None
+        # the site blocks us or is overloaded, so we have to slow down
+        if status_code in (403, 429) or status_code >= 500:
+            limiter.record_failure('status code %s' % status_code, retry_after)
+        if status_code == 429:
+            reason = 'too_many_requests'
+        elif status_code >= 500:
+            reason = 'server_error'
+        else:
+            reason = 'client_error'
+        return RequestFailed('Get status code %s.' % status_code, url,
+                             status_code=status_code, retry_after=retry_after, reason=reason)
+
+    def _before_attempt(self, url):
+        breaker = self._breakers.breaker(url)
+        if not breaker.allow():
+            raise CircuitOpen(url, breaker.retry_in())
+        return breaker
+
+    def _after_failed_attempt(self, breaker, ex, attempt):
+        """ Return delay before the next attempt or None if request shouldn't be repeated """
+        # errors of a single page (404 or 500 for example) mean that the host itself works
+        if breaker.is_host_failure(ex):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if not self._retry_policy.should_retry(ex, attempt):
+            return None
+        delay = self._retry_policy.delay(attempt, ex.retry_after)
+        self.module_logger.warning('%s Retry %s/%s in %.1f sec.'
+                                   % (ex, attempt + 1, self._retry_policy.max_attempts, delay))
+        return delay
+
     async def _get_page(self, url, session):
+        attempt = 0
+        while True:
+            breaker = self._before_attempt(url)
+            attempt += 1
+            try:
+                response_text = await self._fetch_page(url, session)
+            except RequestFailed as ex:
+                delay = self._after_failed_attempt(breaker, ex, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+            else:
+                breaker.record_success()
+                return response_text
+
+    # Site blocks access when requests are too frequent, the host limiter slows down on such responses
+    async def _fetch_page(self, url, session):
+        cached = self._cached_page(url)
+        if cached and cached.fresh:
+            self.metrics.response(url, 'cache')
+            return cached.body
+
+        limiter = self._scheduler.limiter(url)
+        start = time.perf_counter()
         try:
-            async with session.get(url=url, headers=self.headers, ssl=True,
-                                       timeout=self._time_out) as response:
-                response_text = await response.text()
-                status_code = response.status
-                response.raise_for_status()
+            async with limiter:
+                self.metrics.observe(url, 'queue', time.perf_counter() - start)
+                start = time.perf_counter()
+                async with session.get(url=url, headers=self._request_headers(cached), ssl=True,
+                                       timeout=aiohttp.ClientTimeout(total=self._time_out),
+                                       trace_request_ctx={'url': url, 'metrics': self.metrics}) as response:
+                    self.metrics.observe(url, 'ttfb', time.perf_counter() - start)
+                    self.metrics.response(url, response.status)
+                    response.raise_for_status()
+                    if cached and response.status == 304:
+                        self._cache.touch(url)
+                        response_text = cached.body
+                    else:
+                        start = time.perf_counter()
+                        body = await response.read()
+                        self.metrics.observe(url, 'download', time.perf_counter() - start)
+                        self.metrics.transferred(url, len(body))
+                        response_text = self._page_content(url, body, response.headers)
 
         except ClientResponseError as ex:
-            raise RequestFailed('Get status code %s.' % status_code, url) from ex
+            raise self._http_error(limiter, url, ex.status, ex.headers) from ex
 
         except TimeoutError as ex:
-            raise RequestFailed('Timeout (%s sec) expired.' % self._time_out, url) from ex
+            limiter.record_failure('timeout')
+            raise RequestFailed('Timeout (%s sec) expired.' % self._time_out, url, reason='timeout') from ex
 
-        except ClientConnectorError as ex:
-            raise RequestFailed('ConnectionError.', url) from ex
+        except ClientConnectionError as ex:
+            raise RequestFailed('ConnectionError.', url, reason='connection') from ex
 
         except Exception as ex:
             raise RequestFailed('Exception %s.' % ex, url) from ex
 
         else:
+            limiter.record_success()
             return response_text
 
     # Sync version _get_page for outer use
     def get_page(self, url, session=None):
         """ Make a request by applying all the request parameters specified in the class (headers for example) """
-        try:
-            if session:
-                request_object = session
+        attempt = 0
+        while True:
+            breaker = self._before_attempt(url)
+            attempt += 1
+            try:
+                response_text = self._fetch_page_sync(url, session)
+            except RequestFailed as ex:
+                delay = self._after_failed_attempt(breaker, ex, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
             else:
-                request_object = requests
-            response = request_object.get(url, headers=self.headers, timeout=self._time_out)
+                breaker.record_success()
+                return response_text
+
+    def _fetch_page_sync(self, url, session=None):
+        cached = self._cached_page(url)
+        if cached and cached.fresh:
+            self.metrics.response(url, 'cache')
+            return cached.body
+
+        limiter = self._scheduler.limiter(url)
+        start = time.perf_counter()
+        try:
+            request_object = session or self._pool.http_session()
+            with limiter:
+                self.metrics.observe(url, 'queue', time.perf_counter() - start)
+                start = time.perf_counter()
+                response = request_object.get(url, headers=self._request_headers(cached),
+                                              timeout=self._time_out)
+            # requests reads the whole body, elapsed is the time until headers were parsed
+            ttfb = response.elapsed.total_seconds()
+            self.metrics.observe(url, 'ttfb', ttfb)
+            self.metrics.observe(url, 'download', max(0, time.perf_counter() - start - ttfb))
+            self.metrics.response(url, response.status_code)
+            self.metrics.transferred(url, len(response.content))
             response.raise_for_status()
-            response.encoding = 'utf-8'
-            response_text = response.text
+            if cached and response.status_code == 304:
+                self._cache.touch(url)
+                response_text = cached.body
+            else:
+                response_text = self._page_content(url, response.content, response.headers)
         except HTTPError as ex:
-            raise RequestFailed('Get status code %s.' % response.status_code, url) from ex
+            raise self._http_error(limiter, url, response.status_code, response.headers) from ex
         except Timeout as ex:
-            raise RequestFailed('Timeout (%s sec) expired.' % self._time_out, url) from ex
+            limiter.record_failure('timeout')
+            raise RequestFailed('Timeout (%s sec) expired.' % self._time_out, url, reason='timeout') from ex
         except ConnectionError as ex:
-            raise RequestFailed('ConnectionError.', url) from ex
+            raise RequestFailed('ConnectionError.', url, reason='connection') from ex
         except RequestException as ex:
             raise RequestFailed('RequestException %s.' % ex, url) from ex
         else:
+            limiter.record_success()
             return response_text
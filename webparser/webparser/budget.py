@@ -0,0 +1,28 @@
+import asyncio
+
+
+class ByteBudget():
+    """
+     Limits the size of pages which are fetched but not parsed yet. acquire waits until there is room
+     for the page, a page bigger than the whole budget is let in when nothing else is in flight.
+     limit=None means no limit.
+    """
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.in_flight = 0
+        self.peak = 0
+        self._released = None
+
+    async def acquire(self, size):
+        while self.limit is not None and self.in_flight and self.in_flight + size > self.limit:
+            if self._released is None:
+                self._released = asyncio.Event()
+            self._released.clear()
+            await self._released.wait()
+        self.in_flight += size
+        self.peak = max(self.peak, self.in_flight)
+
+    def release(self, size):
+        self.in_flight -= size
+        if self._released is not None:
+            self._released.set()
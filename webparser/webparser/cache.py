@@ -0,0 +1,64 @@
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+
+CachedPage = namedtuple('CachedPage', ['url', 'body', 'etag', 'last_modified', 'fetched_at', 'fresh'])
+
+
+class HTTPCache():
+    """
+     Persistent cache of fetched pages in SQLite.
+     Pages younger than ttl of their url kind ('listing' or 'article') are served without a request,
+     older ones are revalidated with If-None-Match/If-Modified-Since, and 304 is served from the cache.
+     ttl=None means a page of this kind never expires, ttl=0 means it's always revalidated.
+    """
+    default_ttl = {'listing': 60 * 60, 'article': 7 * 24 * 60 * 60}
+
+    def __init__(self, path='webparser_cache.sqlite', ttl=None):
+        self.path = path
+        self.ttl = dict(self.default_ttl, **(ttl or {}))
+        # the cache is used from the event loop and from sync code, sqlite calls are short
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS pages ('
+                                     'url TEXT PRIMARY KEY, body TEXT, etag TEXT, '
+                                     'last_modified TEXT, fetched_at REAL)')
+
+    def get(self, url, kind='article'):
+        """ Return CachedPage for the url or None if url isn't cached """
+        with self._lock:
+            row = self._connection.execute('SELECT url, body, etag, last_modified, fetched_at '
+                                           'FROM pages WHERE url = ?', (url,)).fetchone()
+        if not row:
+            return None
+        ttl = self.ttl.get(kind)
+        fresh = ttl is None or time.time() - row[4] < ttl
+        return CachedPage(*row, fresh=fresh)
+
+    def store(self, url, body, etag=None, last_modified=None):
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)',
+                                     (url, body, etag, last_modified, time.time()))
+
+    def touch(self, url):
+        """ Page was revalidated by the server (304), so it's fresh again """
+        with self._lock, self._connection:
+            self._connection.execute('UPDATE pages SET fetched_at = ? WHERE url = ?', (time.time(), url))
+
+    @staticmethod
+    def conditional_headers(cached, headers=None):
+        """ Add validators of the cached page to request headers """
+        headers = dict(headers or {})
+        if cached:
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                headers['If-Modified-Since'] = cached.last_modified
+        return headers
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
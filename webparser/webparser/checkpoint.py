@@ -0,0 +1,81 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import date
+
+
+class Checkpoint():
+    """
+     Saves progress of long jobs to SQLite: found links to articles and processed pages with their results.
+     Processed pages are buffered and written every commit_every pages or commit_interval seconds,
+     so after a crash at most this work is lost. Call clear when the job is finished.
+    """
+    def __init__(self, path='webparser_checkpoint.sqlite', commit_every=50, commit_interval=30):
+        self.path = path
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self._pending = []
+        self._committed_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS discovery ('
+                                     'site TEXT, parse_for_days INTEGER, day TEXT, urls TEXT, '
+                                     'PRIMARY KEY (site, parse_for_days))')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS pages ('
+                                     'site TEXT, url TEXT, data TEXT, PRIMARY KEY (site, url))')
+
+    def save_discovery(self, site, parse_for_days, list_urls):
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO discovery VALUES (?, ?, ?, ?)',
+                                     (site, parse_for_days, date.today().isoformat(), json.dumps(list_urls)))
+
+    def discovery(self, site, parse_for_days):
+        """ Links found today for the same parse_for_days or None """
+        with self._lock:
+            row = self._connection.execute('SELECT day, urls FROM discovery WHERE site = ? AND parse_for_days = ?',
+                                           (site, parse_for_days)).fetchone()
+        # the window of dates moves every day
+        if not row or row[0] != date.today().isoformat():
+            return None
+        return json.loads(row[1])
+
+    def page_done(self, site, url, json_data=None):
+        """ Page is processed, json_data is None for skipped pages """
+        data = json.dumps(json_data, ensure_ascii=False) if json_data is not None else None
+        with self._lock:
+            self._pending.append((site, url, data))
+        if len(self._pending) >= self.commit_every or time.monotonic() - self._committed_at >= self.commit_interval:
+            self.flush()
+
+    def flush(self):
+        with self._lock, self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO pages VALUES (?, ?, ?)', self._pending)
+            self._pending = []
+            self._committed_at = time.monotonic()
+
+    def done_pages(self, site):
+        """ {url: page_content} of processed pages, page_content is None for skipped pages """
+        self.flush()
+        with self._lock:
+            rows = self._connection.execute('SELECT url, data FROM pages WHERE site = ?', (site,)).fetchall()
+        return {url: json.loads(data) if data is not None else None for url, data in rows}
+
+    def done_urls(self, site):
+        """ Set of urls of processed pages """
+        self.flush()
+        with self._lock:
+            rows = self._connection.execute('SELECT url FROM pages WHERE site = ?', (site,)).fetchall()
+        return {row[0] for row in rows}
+
+    def clear(self, site):
+        with self._lock, self._connection:
+            self._pending = [page for page in self._pending if page[0] != site]
+            self._connection.execute('DELETE FROM discovery WHERE site = ?', (site,))
+            self._connection.execute('DELETE FROM pages WHERE site = ?', (site,))
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,183 @@
+"""
+ Command line interface of webparser.
+
+ python -m webparser crawl ria mir24 --days 7 --out news.jsonl
+ python -m webparser crawl ria --days 1 --format store --out news_store
+ python -m webparser fetch ria https://ria.ru/20220301/article.html
+ python -m webparser sites
+
+ Only argparse is imported at start, parsers and their dependencies are imported when a command needs them.
+"""
+import argparse
+import json
+import logging
+import sys
+
+
+DEFAULT_USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; WOW64) '
+                      'AppleWebKit/537.36 (KHTML, like Gecko) Chrome/97.0.4692.71 Safari/537.36')
+
+
+class _Stores():
+    """ Optional SQLite stores from command line paths, shared by all parsers of the run """
+    def __init__(self, args):
+        self.kwargs = {}
+        self._stores = []
+        if getattr(args, 'cache', None):
+            from webparser.cache import HTTPCache
+            self._add('cache', HTTPCache(args.cache))
+        if getattr(args, 'seen_index', None):
+            from webparser.index import SeenIndex
+            self._add('seen_index', SeenIndex(args.seen_index))
+        if getattr(args, 'dead_letters', None):
+            from webparser.dead_letters import DeadLetterStore
+            self._add('dead_letters', DeadLetterStore(args.dead_letters))
+        if getattr(args, 'checkpoint', None):
+            from webparser.checkpoint import Checkpoint
+            self._add('checkpoint', Checkpoint(args.checkpoint))
+        if getattr(args, 'duplicates', None):
+            from webparser.dedup import DuplicateIndex
+            self._add('duplicates', DuplicateIndex(args.duplicates))
+            self.kwargs['drop_duplicates'] = args.drop_duplicates
+
+    def _add(self, name, store):
+        self.kwargs[name] = store
+        self._stores.append(store)
+
+    def close(self):
+        for store in self._stores:
+            store.close()
+
+
+def make_parser(site, args, **kwargs):
+    from webparser.registry import load_parser_class
+
+    parser_class = load_parser_class(site)
+    log_handlers = [logging.FileHandler(args.log_file, encoding='utf-8')] if args.log_file else []
+    pause_between_requests = 1 / args.rate if args.rate else 0
+    metrics_path = '%s.%s' % (args.metrics, site) if getattr(args, 'metrics', None) else None
+    return parser_class({'User-Agent': args.user_agent}, args.verbosity, pause_between_requests, args.timeout,
+                        *log_handlers, max_concurrency=args.concurrency, parse_workers=args.workers,
+                        metrics_path=metrics_path, metrics_format=args.metrics_format,
+                        metrics_per_url=getattr(args, 'metrics_per_url', False),
+                        articles=getattr(args, 'format', None) in ('articles', 'store'), **kwargs)
+
+
+def crawl(args):
+    from webparser.orchestrator import Orchestrator
+    from webparser.sinks import JSONLinesSink, ArticleSink
+
+    stores = _Stores(args)
+    try:
+        orchestrator = Orchestrator([make_parser(site, args, **stores.kwargs) for site in args.sites])
+        if args.format in ('jsonl', 'articles'):
+            out = open(args.out, 'w', encoding='utf-8') if args.out else sys.stdout
+            sink_class = ArticleSink if args.format == 'articles' else JSONLinesSink
+            try:
+                with sink_class(out) as sink:
+                    orchestrator.crawl(args.days, sink, skip_seen=not args.all)
+            finally:
+                if args.out:
+                    out.close()
+        elif args.format == 'store':
+            from webparser.store import ShardedStore
+
+            with ShardedStore(args.out, args.compression) as store:
+                orchestrator.crawl(args.days, store, skip_seen=not args.all)
+        else:
+            json_data = {}
+            for pages in orchestrator.crawl(args.days, skip_seen=not args.all).values():
+                json_data.update(pages)
+            if args.out:
+                with open(args.out, 'w', encoding='utf-8') as file:
+                    json.dump(json_data, file, indent=4, ensure_ascii=False)
+            else:
+                json.dump(json_data, sys.stdout, indent=4, ensure_ascii=False)
+        print(json.dumps(orchestrator.stats(), indent=4, default=str), file=sys.stderr)
+    finally:
+        stores.close()
+
+
+def fetch(args):
+    """ Fetch one page of the site and print its raw content or the parsed article """
+    stores = _Stores(args)
+    try:
+        with make_parser(args.site, args, **stores.kwargs) as parser:
+            html_data = parser.get_page(args.url)
+            if args.raw:
+                print(html_data)
+            else:
+                json_data = parser.process_parse_page(html_data, source_url=args.url)
+                if hasattr(json_data, 'to_dict'):
+                    json_data = json_data.to_dict(parser.publication_date_format)
+                print(json.dumps(json_data, indent=4, ensure_ascii=False))
+    finally:
+        stores.close()
+
+
+def list_sites(args):
+    from webparser.registry import SITE_PARSERS
+
+    for site in sorted(SITE_PARSERS):
+        print('%-10s %s' % (site, SITE_PARSERS[site]))
+
+
+def _add_common_arguments(parser):
+    parser.add_argument('--concurrency', type=int, default=10, help='pages fetched at the same time by a site')
+    parser.add_argument('--rate', type=float, default=1, help='requests per second to one host, 0 for no limit')
+    parser.add_argument('--timeout', type=float, default=5, help='timeout of a request, sec')
+    parser.add_argument('--workers', type=int, default=0, help='processes for parsing pages, 0 to parse in place')
+    parser.add_argument('--cache', help='path of HTTP cache database')
+    parser.add_argument('--user-agent', default=DEFAULT_USER_AGENT)
+    parser.add_argument('--verbosity', default='warning', choices=['debug', 'info', 'warning', 'error', 'critical'])
+    parser.add_argument('--log-file', help='log file, webparser.log by default')
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog='python -m webparser', description='Parse news sites')
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+
+    crawl_parser = subparsers.add_parser('crawl', help='collect and parse articles of the sites')
+    crawl_parser.add_argument('sites', nargs='+', metavar='site', help='name of the site, see sites command')
+    crawl_parser.add_argument('--days', type=int, default=0,
+                              help='parse articles for this number of days, 0 for today, -1 for all')
+    crawl_parser.add_argument('--out', help='output file, stdout by default, directory for store format')
+    crawl_parser.add_argument('--format', default='jsonl', choices=['jsonl', 'json', 'articles', 'store'],
+                              help='articles is compact form of Article, one per line, '
+                                   'store is compressed shards with an index')
+    crawl_parser.add_argument('--compression', default='gzip', choices=['gzip', 'zstd'],
+                              help='compression of store shards, zstd requires zstandard package')
+    crawl_parser.add_argument('--seen-index', help='path of the index of collected articles for incremental crawl')
+    crawl_parser.add_argument('--all', action='store_true', help='parse articles which are in the seen index too')
+    crawl_parser.add_argument('--checkpoint', help='path of checkpoint database to resume interrupted crawl')
+    crawl_parser.add_argument('--dead-letters', help='path of database of failed urls')
+    crawl_parser.add_argument('--duplicates', help='path of the index of article fingerprints to find near-duplicates')
+    crawl_parser.add_argument('--drop-duplicates', action='store_true',
+                              help='drop near-duplicates instead of adding duplicate_of to them')
+    crawl_parser.add_argument('--metrics', help='prefix of metrics files, site name and .collect or .parse are added to it')
+    crawl_parser.add_argument('--metrics-format', default='json', choices=['json', 'prometheus'])
+    crawl_parser.add_argument('--metrics-per-url', action='store_true', help='add timings of every url to metrics')
+    _add_common_arguments(crawl_parser)
+    crawl_parser.set_defaults(function=crawl)
+
+    fetch_parser = subparsers.add_parser('fetch', help='fetch and parse one article')
+    fetch_parser.add_argument('site')
+    fetch_parser.add_argument('url')
+    fetch_parser.add_argument('--raw', action='store_true', help='print the page instead of parsed article')
+    _add_common_arguments(fetch_parser)
+    fetch_parser.set_defaults(function=fetch, metrics_format='json')
+
+    sites_parser = subparsers.add_parser('sites', help='list known sites')
+    sites_parser.set_defaults(function=list_sites)
+
+    args = arg_parser.parse_args(argv)
+    if args.command == 'crawl' and args.format == 'store' and not args.out:
+        arg_parser.error('--out directory is required for store format')
+    if args.command != 'sites':
+        from webparser.registry import SITE_PARSERS, sites
+
+        unknown_sites = [site for site in getattr(args, 'sites', [getattr(args, 'site', None)])
+                         if site not in SITE_PARSERS]
+        if unknown_sites:
+            arg_parser.error('unknown site %s, known sites: %s' % (', '.join(unknown_sites), ', '.join(sites())))
+    args.function(args)
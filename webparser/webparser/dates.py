@@ -0,0 +1,117 @@
+import re
+from datetime import date, datetime, timedelta
+
+
+class DateParser():
+    """
+     Parses dates of the fixed formats used by a site without dateparser.
+     Tries, in order: precompiled regex for each of date_formats, Russian relative dates
+     ("Вчера, 14:30", "5 мая, 14:30", "14:30") and only on a miss falls back to dateparser.
+     Results are cached, because listing pages repeat the same dates many times.
+    """
+    months = {'январ': 1, 'феврал': 2, 'март': 3, 'апрел': 4, 'ма': 5, 'июн': 6,
+              'июл': 7, 'август': 8, 'сентябр': 9, 'октябр': 10, 'ноябр': 11, 'декабр': 12}
+    month_endings = re.compile(r'(я|ь|а|е|й)$')
+    relative_days = {'сегодня': 0, 'вчера': 1, 'позавчера': 2}
+
+    # how many values of each directive can be matched, only numeric directives are supported
+    _directives = {'d': r'(\d{1,2})', 'm': r'(\d{1,2})', 'Y': r'(\d{4})', 'y': r'(\d{2})',
+                   'H': r'(\d{1,2})', 'M': r'(\d{1,2})', 'S': r'(\d{1,2})'}
+    _time = re.compile(r'(\d{1,2}):(\d{2})')
+    _day_month = re.compile(r'(\d{1,2})\s+([а-яё]+)\.?(?:\s+(\d{4}))?')
+    _noise = re.compile(r'[\s,.]+|\bв\b|\bг\b|\bгода\b')
+
+    def __init__(self, date_formats=None, cache_size=10000):
+        self.date_formats = list(date_formats or [])
+        self._patterns = [self._compile_format(date_format) for date_format in self.date_formats]
+        self._cache_size = cache_size
+        self._cache = {}
+        self._cache_day = None
+
+    def _compile_format(self, date_format):
+        """
+         Build regex for a strptime format. Separators between directives are matched loosely,
+         so '%H %M %d %m %Y' also matches '14:30 05.06.2022'.
+        """
+        fields = []
+        pattern = ''
+        for literal, directive in re.findall(r'([^%]*)%(.)', date_format):
+            if directive not in self._directives:
+                raise ValueError('Directive %%%s is not supported by fast date parsing' % directive)
+            pattern += r'\W*' if literal else ''
+            pattern += self._directives[directive]
+            fields.append(directive)
+        return re.compile(r'\W*%s\W*' % pattern), fields
+
+    def parse(self, date_string, prefer_past=False):
+        """ Return datetime for the given string or None if it can't be parsed """
+        today = date.today()
+        # relative dates depend on the current day
+        if self._cache_day != today or len(self._cache) >= self._cache_size:
+            self._cache.clear()
+            self._cache_day = today
+
+        key = (date_string, prefer_past)
+        if key not in self._cache:
+            self._cache[key] = self._parse(date_string, prefer_past, today)
+        return self._cache[key]
+
+    def _parse(self, date_string, prefer_past, today):
+        date_string = date_string.strip()
+        for pattern, fields in self._patterns:
+            match = pattern.fullmatch(date_string)
+            if match:
+                values = dict(zip(fields, map(int, match.groups())))
+                if 'y' in values:
+                    values['Y'] = 2000 + values['y']
+                try:
+                    return datetime(values.get('Y', today.year), values.get('m', 1), values.get('d', 1),
+                                    values.get('H', 0), values.get('M', 0), values.get('S', 0))
+                except ValueError:
+                    break
+
+        parsed_date = self._parse_russian(date_string.lower(), prefer_past, today)
+        if parsed_date:
+            return parsed_date
+        return self._parse_fallback(date_string, prefer_past)
+
+    def _parse_russian(self, date_string, prefer_past, today):
+        hour, minute = 0, 0
+        time_match = self._time.search(date_string)
+        if time_match:
+            hour, minute = int(time_match.group(1)), int(time_match.group(2))
+            date_string = date_string[:time_match.start()] + ' ' + date_string[time_match.end():]
+
+        rest = self._noise.sub(' ', date_string).strip()
+        day_month = self._day_month.fullmatch(rest)
+        if not rest:
+            if not time_match:
+                return None
+            parsed_date = today
+        elif rest in self.relative_days:
+            parsed_date = today - timedelta(days=self.relative_days[rest])
+        elif day_month:
+            month = self.months.get(self.month_endings.sub('', day_month.group(2)))
+            if not month:
+                return None
+            year = int(day_month.group(3)) if day_month.group(3) else today.year
+            try:
+                parsed_date = date(year, month, int(day_month.group(1)))
+            except ValueError:
+                return None
+            if prefer_past and not day_month.group(3) and parsed_date > today:
+                parsed_date = parsed_date.replace(year=year - 1)
+        else:
+            return None
+
+        try:
+            return datetime(parsed_date.year, parsed_date.month, parsed_date.day, hour, minute)
+        except ValueError:
+            return None
+
+    def _parse_fallback(self, date_string, prefer_past):
+        # dateparser is slow to import and to run, so it is used only for unknown formats
+        import dateparser
+
+        settings = {'PREFER_DATES_FROM': 'past'} if prefer_past else None
+        return dateparser.parse(date_string, settings=settings, date_formats=self.date_formats or None)
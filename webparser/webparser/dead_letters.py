@@ -0,0 +1,57 @@
+import sqlite3
+import threading
+import time
+
+
+class DeadLetterStore():
+    """
+     Persistent store of urls which could not be parsed, with the reason of the failure.
+     reason is RequestFailed.reason for failed requests, 'not_html', 'parse_error' or 'skipped'.
+     Retryable urls can be processed again with BaseParser.replay.
+    """
+    def __init__(self, path='webparser_dead_letters.sqlite'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS dead_letters ('
+                                     'site TEXT, url TEXT, reason TEXT, status_code INTEGER, message TEXT, '
+                                     'retryable INTEGER, attempts INTEGER, failed_at REAL, '
+                                     'PRIMARY KEY (site, url))')
+
+    def add(self, site, url, reason, message='', status_code=None, retryable=False):
+        with self._lock, self._connection:
+            self._connection.execute('INSERT INTO dead_letters VALUES (?, ?, ?, ?, ?, ?, 1, ?) '
+                                     'ON CONFLICT (site, url) DO UPDATE SET reason = excluded.reason, '
+                                     'status_code = excluded.status_code, message = excluded.message, '
+                                     'retryable = excluded.retryable, attempts = attempts + 1, '
+                                     'failed_at = excluded.failed_at',
+                                     (site, url, reason, status_code, message, int(retryable), time.time()))
+
+    def remove(self, site, url):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM dead_letters WHERE site = ? AND url = ?', (site, url))
+
+    def urls(self, site, reasons=None):
+        """ Urls of the site failed with one of reasons, if reasons is None returns all retryable urls """
+        query = 'SELECT url FROM dead_letters WHERE site = ?'
+        params = [site]
+        if reasons is None:
+            query += ' AND retryable = 1'
+        else:
+            reasons = list(reasons)
+            query += ' AND reason IN (%s)' % ', '.join('?' * len(reasons))
+            params.extend(reasons)
+        with self._lock:
+            return [row[0] for row in self._connection.execute(query, params)]
+
+    def records(self, site):
+        """ All failures of the site as dicts """
+        with self._lock:
+            cursor = self._connection.execute('SELECT * FROM dead_letters WHERE site = ? ORDER BY failed_at', (site,))
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
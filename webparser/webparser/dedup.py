@@ -0,0 +1,136 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+
+from webparser.models import Article
+
+
+# blocks of article content which make its text, images and tables are not compared
+TEXT_BLOCKS = ('text', 'quote', 'list', 'h1', 'h2', 'h3', 'h4', 'h5')
+_BITS = 64
+_WORD = re.compile(r'\w+')
+
+
+def article_text(json_data):
+    """ Text of Article or process_parse_page dict without title, images and tables """
+    if isinstance(json_data, Article):
+        blocks = ((block.type, block.value) for block in json_data.content)
+    else:
+        blocks = (item for block in json_data.get('content', ()) for item in block.items())
+    parts = []
+    for block_type, value in blocks:
+        if block_type in TEXT_BLOCKS:
+            parts.extend(value if isinstance(value, list) else [value])
+    return ' '.join(part for part in parts if isinstance(part, str))
+
+
+def simhash(text, shingle_size=3):
+    """
+     64-bit SimHash of word shingles of the text, texts which differ in a few words have fingerprints
+     which differ in a few bits. None if the text is shorter than a shingle
+    """
+    words = _WORD.findall(text.lower())
+    shingles = {' '.join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+    if not shingles:
+        return None
+    # blake2b is stable between runs unlike hash()
+    bits = [format(int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big'), '064b')
+            for shingle in shingles]
+    # a bit of the fingerprint is set if it's set in most of the shingle hashes
+    return int(''.join('1' if column.count('1') * 2 > len(bits) else '0' for column in zip(*bits)), 2)
+
+
+def _to_signed(fingerprint):
+    """ SQLite integers are signed 64-bit """
+    return fingerprint - (1 << _BITS) if fingerprint >= 1 << (_BITS - 1) else fingerprint
+
+
+class DuplicateIndex():
+    """
+     Persistent index of SimHash fingerprints of article texts to find near-duplicates across sites and runs:
+     the same agency story republished by several sites or an article available under several urls.
+     Articles are duplicates if their fingerprints differ in at most max_distance bits, a few changed words
+     or an added sentence change 2-6 bits of 600 words article, unrelated articles differ in 20-40 bits.
+     Fingerprints are split into bands and only articles with an equal band are compared (LSH) instead of
+     the whole index. By default there are max_distance + 1 bands, so all duplicates have an equal band,
+     fewer and wider bands compare fewer candidates but miss some of the most distant duplicates.
+     Texts shorter than min_words are not checked, their fingerprints are not reliable.
+     One index can be shared by parsers of several sites, see BaseParser duplicates.
+    """
+    def __init__(self, path='webparser_duplicates.sqlite', max_distance=6, bands=None, min_words=30):
+        self.path = path
+        self.max_distance = max_distance
+        self.bands = bands or max_distance + 1
+        self.min_words = min_words
+        # bounds of bands, all bits are used even if they can't be split equally
+        self._band_bounds = [band * _BITS // self.bands for band in range(self.bands + 1)]
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS fingerprints ('
+                                     'site TEXT, url TEXT, fingerprint INTEGER, added_at REAL, '
+                                     'PRIMARY KEY (site, url))')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS bands (band INTEGER, key INTEGER, site TEXT, url TEXT)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS bands_key ON bands (band, key)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS duplicates ('
+                                     'site TEXT, url TEXT, original_site TEXT, original_url TEXT, distance INTEGER, '
+                                     'found_at REAL, PRIMARY KEY (site, url))')
+
+    def _bands(self, fingerprint):
+        return [(band, (fingerprint >> start) & ((1 << (end - start)) - 1))
+                for band, (start, end) in enumerate(zip(self._band_bounds, self._band_bounds[1:]))]
+
+    def check(self, site, url, json_data):
+        """
+         Return (site, url) of the article which the given one duplicates or None.
+         Originals are added to the index, duplicates are saved with their originals.
+        """
+        text = article_text(json_data)
+        if len(_WORD.findall(text)) < self.min_words:
+            return None
+        fingerprint = simhash(text)
+        bands = self._bands(fingerprint)
+        with self._lock, self._connection:
+            original = self._nearest(site, url, fingerprint, bands)
+            if original is not None:
+                original_site, original_url, distance = original
+                self._connection.execute('INSERT OR REPLACE INTO duplicates VALUES (?, ?, ?, ?, ?, ?)',
+                                         (site, url, original_site, original_url, distance, time.time()))
+                return original_site, original_url
+            # parsed again, its text could change
+            self._connection.execute('DELETE FROM duplicates WHERE site = ? AND url = ?', (site, url))
+            self._connection.execute('DELETE FROM bands WHERE site = ? AND url = ?', (site, url))
+            self._connection.execute('INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?)',
+                                     (site, url, _to_signed(fingerprint), time.time()))
+            self._connection.executemany('INSERT INTO bands VALUES (?, ?, ?, ?)',
+                                         [(band, key, site, url) for band, key in bands])
+        return None
+
+    def _nearest(self, site, url, fingerprint, bands):
+        """ The closest candidate with an equal band within max_distance, the article itself is not a duplicate """
+        query = ' UNION '.join(['SELECT site, url FROM bands WHERE band = ? AND key = ?'] * len(bands))
+        candidates = self._connection.execute(
+            'SELECT f.site, f.url, f.fingerprint FROM fingerprints f JOIN (%s) c ON f.site = c.site AND f.url = c.url'
+            % query, [value for band in bands for value in band]).fetchall()
+        nearest = None
+        for candidate_site, candidate_url, candidate in candidates:
+            if (candidate_site, candidate_url) == (site, url):
+                continue
+            distance = bin((candidate & ((1 << _BITS) - 1)) ^ fingerprint).count('1')
+            if distance <= self.max_distance and (nearest is None or distance < nearest[2]):
+                nearest = (candidate_site, candidate_url, distance)
+        return nearest
+
+    def duplicates(self, site=None):
+        """ List of (site, url, original_site, original_url, distance) """
+        query = 'SELECT site, url, original_site, original_url, distance FROM duplicates'
+        with self._lock:
+            if site is None:
+                return self._connection.execute(query).fetchall()
+            return self._connection.execute(query + ' WHERE site = ?', (site,)).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,40 @@
+import sqlite3
+import threading
+import time
+
+
+class SeenIndex():
+    """
+     Persistent index of already collected articles for every site: url and publication date.
+     It allows to stop collecting links at the first page of known articles and not to parse them again.
+    """
+    def __init__(self, path='webparser_index.sqlite'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS articles ('
+                                     'site TEXT, url TEXT, published TEXT, collected_at REAL, '
+                                     'PRIMARY KEY (site, url))')
+
+    def add(self, site, url, published=None):
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO articles VALUES (?, ?, ?, ?)',
+                                     (site, url, published, time.time()))
+
+    def known(self, site, urls):
+        """ Return the set of urls from the given ones which are already in the index """
+        urls = list(set(urls))
+        known_urls = set()
+        # sqlite limits the number of query parameters
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            with self._lock:
+                rows = self._connection.execute('SELECT url FROM articles WHERE site = ? AND url IN (%s)'
+                                                % ', '.join('?' * len(chunk)), (site, *chunk)).fetchall()
+            known_urls.update(row[0] for row in rows)
+        return known_urls
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
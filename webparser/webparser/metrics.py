@@ -0,0 +1,131 @@
+import json
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+class Histogram():
+    """ Histogram with fixed buckets, buckets are upper bounds of values """
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = None
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """ Approximate quantile: upper bound of the bucket where it is """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': self.sum, 'mean': self.sum / self.count if self.count else None,
+                'p50': self.quantile(0.5), 'p90': self.quantile(0.9), 'p99': self.quantile(0.99), 'max': self.max,
+                'buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'], self.counts))}
+
+
+class ParseMetrics():
+    """
+     Timings of the phases of fetching and parsing pages, bytes transferred and status codes.
+     Phases: queue (waiting for the host limiter), connect (new connections only), ttfb, download,
+     html_parse (building soup), extraction (the rest of process_parse_page), serialization (writing to sink).
+     per_url=True also keeps timings of every url, memory grows with the number of urls then.
+    """
+    phases = ('queue', 'connect', 'ttfb', 'download', 'html_parse', 'extraction', 'serialization')
+    time_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    size_buckets = tuple(1024 * 4 ** power for power in range(8))
+
+    def __init__(self, site=None, per_url=False):
+        self.site = site
+        self.per_url = per_url
+        self.reset()
+
+    def reset(self):
+        self.timings = {phase: Histogram(self.time_buckets) for phase in self.phases}
+        self.response_bytes = Histogram(self.size_buckets)
+        self.status_codes = Counter()
+        self.urls = {}
+
+    def observe(self, url, phase, seconds):
+        self.timings[phase].observe(seconds)
+        if self.per_url:
+            url_timings = self.urls.setdefault(url, {})
+            url_timings[phase] = url_timings.get(phase, 0) + seconds
+
+    @contextmanager
+    def timer(self, url, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(url, phase, time.perf_counter() - start)
+
+    def response(self, url, status):
+        """ status is http status code or 'cache' for pages served from the cache """
+        self.status_codes[str(status)] += 1
+        if self.per_url:
+            self.urls.setdefault(url, {})['status'] = status
+
+    def transferred(self, url, size):
+        self.response_bytes.observe(size)
+        if self.per_url:
+            self.urls.setdefault(url, {})['bytes'] = size
+
+    def histograms(self):
+        histograms = {phase: histogram.to_dict() for phase, histogram in self.timings.items()}
+        histograms['response_bytes'] = self.response_bytes.to_dict()
+        return histograms
+
+    def to_dict(self):
+        return {'site': self.site, 'phases': self.histograms(), 'status_codes': dict(self.status_codes),
+                'bytes_total': self.response_bytes.sum, 'urls': self.urls if self.per_url else None}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=4)
+
+    def to_prometheus(self, prefix='webparser'):
+        """ Metrics in Prometheus text exposition format """
+        site = 'site="%s"' % self.site
+        lines = ['# TYPE %s_phase_seconds histogram' % prefix]
+        for phase, histogram in self.timings.items():
+            labels = '%s,phase="%s"' % (site, phase)
+            lines.extend(self._prometheus_histogram('%s_phase_seconds' % prefix, labels, histogram))
+        lines.append('# TYPE %s_response_bytes histogram' % prefix)
+        lines.extend(self._prometheus_histogram('%s_response_bytes' % prefix, site, self.response_bytes))
+        lines.append('# TYPE %s_responses_total counter' % prefix)
+        for status, count in sorted(self.status_codes.items()):
+            lines.append('%s_responses_total{%s,status="%s"} %s' % (prefix, site, status, count))
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _prometheus_histogram(name, labels, histogram):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+            cumulative += count
+            lines.append('%s_bucket{%s,le="%s"} %s' % (name, labels, bound, cumulative))
+        lines.append('%s_sum{%s} %s' % (name, labels, histogram.sum))
+        lines.append('%s_count{%s} %s' % (name, labels, histogram.count))
+        return lines
+
+    def dump(self, path, format='json'):
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(self.to_prometheus() if format == 'prometheus' else self.to_json())
@@ -0,0 +1,113 @@
+import json
+from dataclasses import dataclass
+from datetime import datetime
+
+
+@dataclass
+class Image():
+    __slots__ = ('source', 'title')
+    source: str
+    title: str
+
+
+@dataclass
+class Table():
+    __slots__ = ('head', 'body')
+    head: list
+    body: list
+
+
+@dataclass
+class ContentBlock():
+    """
+     Block of article content. type is 'text', 'quote', 'list', 'image', 'table' or header tag 'h1'-'h5',
+     value is str for text, quote and headers, list of str for list, Image or Table.
+    """
+    __slots__ = ('type', 'value')
+    type: str
+    value: object
+
+    def to_dict(self):
+        """ Block in the format of process_parse_page dicts: {type: value} """
+        if isinstance(self.value, Image):
+            value = {'source': self.value.source}
+            if self.value.title is not None:
+                value['title'] = self.value.title
+        elif isinstance(self.value, Table):
+            value = {'head': self.value.head, 'body': self.value.body}
+        else:
+            value = self.value
+        return {self.type: value}
+
+    def to_record(self):
+        if isinstance(self.value, Image):
+            return [self.type, [self.value.source, self.value.title]]
+        if isinstance(self.value, Table):
+            return [self.type, [self.value.head, self.value.body]]
+        return [self.type, self.value]
+
+    @classmethod
+    def from_record(cls, record):
+        block_type, value = record
+        if block_type == 'image':
+            value = Image(*value)
+        elif block_type == 'table':
+            value = Table(*value)
+        return cls(block_type, value)
+
+
+@dataclass
+class Article():
+    """
+     Parsed article, published is naive datetime in the time zone of the site.
+     duplicate_of is url of the article which this one duplicates, see DuplicateIndex, it's not compared by ==
+    """
+    __slots__ = ('url', 'site', 'title', 'published', 'content', 'duplicate_of')
+    url: str
+    site: str
+    title: str
+    published: datetime
+    content: list
+
+    def __post_init__(self):
+        self.duplicate_of = None
+
+    def to_dict(self, date_format='parts'):
+        """
+         Article in the format of process_parse_page dicts. date_format is 'parts' for publication_date
+         as {'year': ..., 'minute': ...} or 'str' for str(datetime)
+        """
+        if date_format == 'str':
+            publication_date = str(self.published)
+        else:
+            publication_date = {'year': self.published.year, 'month': self.published.month,
+                                'day': self.published.day, 'hour': self.published.hour,
+                                'minute': self.published.minute}
+        json_data = {'content': [block.to_dict() for block in self.content],
+                     'publication_date': publication_date, 'title': self.title}
+        if self.duplicate_of is not None:
+            json_data['duplicate_of'] = self.duplicate_of
+        return json_data
+
+    def to_record(self):
+        """ Compact json-serializable form, blocks are [type, value] lists """
+        record = {'url': self.url, 'site': self.site, 'title': self.title, 'published': self.published.isoformat(),
+                  'content': [block.to_record() for block in self.content]}
+        if self.duplicate_of is not None:
+            record['duplicate_of'] = self.duplicate_of
+        return record
+
+    @classmethod
+    def from_record(cls, record):
+        article = cls(record['url'], record['site'], record['title'], datetime.fromisoformat(record['published']),
+                      [ContentBlock.from_record(block) for block in record['content']])
+        article.duplicate_of = record.get('duplicate_of')
+        return article
+
+    def dumps(self):
+        """ One line of json without spaces """
+        return json.dumps(self.to_record(), ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def loads(cls, line):
+        return cls.from_record(json.loads(line))
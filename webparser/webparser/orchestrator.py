@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+import aiohttp
+
+from webparser.base import connect_trace_config
+
+
+class Orchestrator():
+    """
+     Runs several parsers in one event loop with one connection pool.
+     Every site goes from collect_list_urls to parse on its own, so a slow site doesn't hold the others
+     and the whole crawl takes about as long as the slowest site. Politeness limits stay per host.
+    """
+    def __init__(self, parsers, max_connections=None):
+        self.parsers = list(parsers)
+        self.max_connections = max_connections or sum(parser._max_concurrency for parser in self.parsers)
+        self.list_urls = {}
+        self.errors = {}
+        self.wall_time = None
+
+    def _client_session(self):
+        """ Session without default headers and timeout, parsers pass their own with every request """
+        connector = aiohttp.TCPConnector(limit=self.max_connections)
+        return aiohttp.ClientSession(connector=connector, trace_configs=[connect_trace_config()])
+
+    async def aiter_crawl(self, parse_for_days=-1, skip_seen=True):
+        """
+         Async iterator over (site, url, page_content) of all sites as soon as pages are ready.
+         parse_for_days has the same meaning as in BaseParser.collect_list_urls.
+         Failure of one site is logged and saved in errors, the others go on.
+        """
+        self.list_urls = {}
+        self.errors = {}
+        start = time.perf_counter()
+        results = asyncio.Queue(maxsize=self.max_connections)
+        async with self._client_session() as session:
+            tasks = [asyncio.create_task(self._crawl_site(parser, parse_for_days, skip_seen, session, results))
+                     for parser in self.parsers]
+            try:
+                finished_sites = 0
+                while finished_sites < len(tasks):
+                    result = await results.get()
+                    if result is None:
+                        finished_sites += 1
+                    else:
+                        site, url, json_data, delivered = result
+                        yield site, url, json_data
+                        delivered.set_result(None)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                self.wall_time = time.perf_counter() - start
+
+    async def _crawl_site(self, parser, parse_for_days, skip_seen, session, results):
+        """ Deliver (site, url, page_content) of the site to results, None means the site is finished """
+        try:
+            list_urls = await parser.acollect_list_urls(parse_for_days, session=session)
+            self.list_urls[parser.site] = list_urls
+            for url, json_data in parser._resumed_pages(list_urls).items():
+                await self._deliver(results, parser.site, url, json_data)
+            async for url, json_data in parser.aiter_parse(list_urls, skip_seen, session=session):
+                await self._deliver(results, parser.site, url, json_data)
+        except Exception as ex:
+            parser.module_logger.error('[%s] Crawl of %s failed: %s' % (parser.__class__.__name__, parser.site, ex))
+            self.errors[parser.site] = ex
+        await results.put(None)
+
+    @staticmethod
+    async def _deliver(results, site, url, json_data):
+        """
+         Wait until the consumer has handled the page, aiter_parse saves it in seen index and checkpoint only then,
+         so pages which are not written to the sink because of a failure are parsed again by the next run
+        """
+        delivered = asyncio.get_running_loop().create_future()
+        await results.put((site, url, json_data, delivered))
+        await delivered
+
+    def crawl(self, parse_for_days=-1, sink=None, skip_seen=True):
+        """
+         Crawl all sites. If sink is given (JSONLinesSink for example), pages of all sites are written to it
+         and stats are returned, otherwise returns {site: {url: page_content}}.
+        """
+        return asyncio.run(self._crawl(parse_for_days, sink, skip_seen))
+
+    async def _crawl(self, parse_for_days, sink, skip_seen):
+        parsers = {parser.site: parser for parser in self.parsers}
+        pages = {site: {} for site in parsers}
+        async for site, url, json_data in self.aiter_crawl(parse_for_days, skip_seen):
+            if sink is not None:
+                with parsers[site].metrics.timer(url, 'serialization'):
+                    sink.write(url, json_data)
+            else:
+                pages[site][url] = json_data
+        return self.stats() if sink is not None else pages
+
+    def stats(self):
+        """ parse_info of every site and the totals """
+        counters = ('num_pages', 'processed', 'collected', 'skipped', 'failed', 'duplicates')
+        sites = {}
+        total = dict.fromkeys(counters, 0)
+        for parser in self.parsers:
+            parse_info = dict(getattr(parser, 'parse_info', {}))
+            parse_info['list_urls'] = len(self.list_urls.get(parser.site, ()))
+            if parser.site in self.errors:
+                parse_info['error'] = str(self.errors[parser.site])
+            sites[parser.site] = parse_info
+            for counter in counters:
+                total[counter] += parse_info.get(counter, 0)
+        total['list_urls'] = sum(len(list_urls) for list_urls in self.list_urls.values())
+        total['wall_sec'] = round(self.wall_time, 3) if self.wall_time is not None else None
+        return {'sites': sites, 'total': total}
@@ -0,0 +1,38 @@
+import re
+
+
+def _brotli_available():
+    # aiohttp and urllib3 decode br only if one of these packages is installed
+    for module in ('brotli', 'brotlicffi'):
+        try:
+            __import__(module)
+            return True
+        except ImportError:
+            pass
+    return False
+
+
+# compression which both aiohttp and requests can decode in this environment
+ACCEPT_ENCODING = 'gzip, deflate, br' if _brotli_available() else 'gzip, deflate'
+
+_charset_re = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+
+
+def content_charset(content_type):
+    """ Charset from Content-Type header or None if it's not declared """
+    match = _charset_re.search(content_type or '')
+    return match.group(1).lower() if match else None
+
+
+class RawPage(bytes):
+    """
+     Content of a page as it came from the server with its charset: the charset declared in Content-Type
+     or utf-8. The page is decoded once, by lxml, when soup is made of it.
+    """
+    def __new__(cls, content, encoding='utf-8'):
+        page = super().__new__(cls, content)
+        page.encoding = encoding
+        return page
+
+    def decode(self, encoding=None, errors='strict'):
+        return super().decode(encoding or self.encoding, errors)
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def _run_loop(loop):
+    """ KeyboardInterrupt raised in a task stops run_forever, the loop goes on to pass it to the caller """
+    while True:
+        try:
+            loop.run_forever()
+            return
+        except BaseException:
+            continue
+
+
+class ConnectionPool():
+    """
+     Long-lived connections of a parser: aiohttp session in the event loop running in a separate thread
+     and requests.Session for sync requests. Connections are kept alive between collect_list_urls and parse,
+     so requests to the same host don't pay for DNS lookup and TCP and TLS handshakes again.
+     size is the number of connections, size_per_host limits connections to one host (0 means no limit),
+     idle connections are closed after keepalive_timeout, resolved addresses are cached for dns_cache_ttl sec.
+     One pool can be shared by several parsers. Call close when it's not needed anymore.
+    """
+    def __init__(self, size=10, size_per_host=0, keepalive_timeout=30, dns_cache_ttl=300, **session_kwargs):
+        self.size = size
+        self.size_per_host = size_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        # headers, timeout, trace_configs and other arguments of aiohttp.ClientSession
+        self._session_kwargs = session_kwargs
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._async_session = None
+        self._requests_session = None
+
+    @property
+    def loop(self):
+        """ Event loop of the pool, it's started with the first use """
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=_run_loop, args=(self._loop,), daemon=True,
+                                                name='webparser-pool')
+                self._thread.start()
+        return self._loop
+
+    def in_loop(self):
+        """ True if it's called from a coroutine running in the loop of the pool """
+        try:
+            return self._loop is not None and asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def run(self, coroutine):
+        """ Run coroutine in the loop of the pool and wait for its result """
+        started = threading.Event()
+        finished = threading.Event()
+
+        async def run():
+            started.set()
+            try:
+                return await coroutine
+            finally:
+                finished.set()
+
+        future = asyncio.run_coroutine_threadsafe(run(), self.loop)
+        try:
+            return future.result()
+        except BaseException:
+            # KeyboardInterrupt while waiting: stop the job and let it save its progress
+            if not future.done():
+                future.cancel()
+                if started.is_set():
+                    finished.wait()
+            raise
+
+    def async_session(self):
+        """ aiohttp session of the pool, must be called from the loop of the pool """
+        if self._async_session is None or self._async_session.closed:
+            connector = aiohttp.TCPConnector(limit=self.size, limit_per_host=self.size_per_host,
+                                             keepalive_timeout=self.keepalive_timeout,
+                                             ttl_dns_cache=self.dns_cache_ttl)
+            self._async_session = aiohttp.ClientSession(connector=connector, **self._session_kwargs)
+        return self._async_session
+
+    def http_session(self):
+        """ requests.Session of the pool for sync requests """
+        with self._lock:
+            if self._requests_session is None:
+                self._requests_session = requests.Session()
+                adapter = HTTPAdapter(pool_maxsize=self.size_per_host or self.size)
+                self._requests_session.mount('http://', adapter)
+                self._requests_session.mount('https://', adapter)
+        return self._requests_session
+
+    def close(self):
+        """ Close all connections and stop the loop, the pool can be used again after it """
+        with self._lock:
+            loop, thread, self._loop, self._thread = self._loop, self._thread, None, None
+            async_session, self._async_session = self._async_session, None
+            requests_session, self._requests_session = self._requests_session, None
+        if loop is not None:
+            if async_session is not None and thread.is_alive():
+                asyncio.run_coroutine_threadsafe(async_session.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+        if requests_session is not None:
+            requests_session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
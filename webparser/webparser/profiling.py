@@ -0,0 +1,126 @@
+import cProfile
+import heapq
+import itertools
+import json
+import pstats
+import random
+import time
+import tracemalloc
+
+
+class PageProfiler():
+    """
+     Profiles process_parse_page page by page and keeps the top slowest and the top most allocating pages
+     with the functions where most of the time was spent. sample_rate is a share of pages to profile,
+     memory=True also measures peak of allocated memory with tracemalloc, which slows parsing down more.
+     Profiles of pages which don't get into the top are thrown away right after the page is parsed.
+    """
+    def __init__(self, top=10, sample_rate=1.0, memory=False, functions=10, report_path=None):
+        self.top = top
+        self.sample_rate = sample_rate
+        self.memory = memory
+        self.functions = functions
+        self.report_path = report_path
+        self.reset()
+
+    def reset(self):
+        # min-heaps of (key, order, record), the smallest is pushed out when a bigger one comes
+        self._slowest = []
+        self._allocating = []
+        self._order = itertools.count()
+        self.profiled = 0
+
+    def run(self, url, function, *args, **kwargs):
+        """
+         Call function, return its result and the record of the page or None if the page was not sampled.
+         functions of the record are None if the page didn't get into any of the tops.
+        """
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return function(*args, **kwargs), None
+
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            profile.disable()
+            seconds = time.perf_counter() - start
+            allocated = tracemalloc.get_traced_memory()[1] - memory_before if self.memory else None
+
+        record = {'url': url, 'seconds': seconds, 'allocated_kb': round(allocated / 1024, 1) if self.memory else None,
+                  'functions': None}
+        if (self._gets_into(self._slowest, seconds)
+                or (self.memory and self._gets_into(self._allocating, record['allocated_kb']))):
+            record['functions'] = self._top_functions(profile)
+        self.add(record)
+        return result, record
+
+    def add(self, record):
+        """ Add record of the page profiled somewhere else, for example in a parse worker process """
+        self.profiled += 1
+        if record['functions'] is None:
+            return
+        self._push(self._slowest, record['seconds'], record)
+        if record['allocated_kb'] is not None:
+            self._push(self._allocating, record['allocated_kb'], record)
+
+    def _gets_into(self, heap, key):
+        return len(heap) < self.top or key > heap[0][0]
+
+    def _push(self, heap, key, record):
+        item = (key, next(self._order), record)
+        if len(heap) < self.top:
+            heapq.heappush(heap, item)
+        elif key > heap[0][0]:
+            heapq.heapreplace(heap, item)
+
+    def _top_functions(self, profile):
+        """ Functions sorted by their own time: [(function, calls, own seconds, cumulative seconds)] """
+        stats = pstats.Stats(profile).stats
+        functions = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:self.functions]
+        return [('%s:%s(%s)' % function, calls, round(own_time, 6), round(cumulative_time, 6))
+                for function, (_, calls, own_time, cumulative_time, _) in functions]
+
+    def slowest(self):
+        return [record for _, _, record in sorted(self._slowest, key=lambda item: item[0], reverse=True)]
+
+    def most_allocating(self):
+        return [record for _, _, record in sorted(self._allocating, key=lambda item: item[0], reverse=True)]
+
+    def report(self):
+        return {'profiled_pages': self.profiled, 'slowest': self.slowest(),
+                'most_allocating': self.most_allocating() if self.memory else None}
+
+    def to_text(self):
+        lines = ['Profiled pages: %s' % self.profiled, '', 'Slowest pages:']
+        for record in self.slowest():
+            lines.extend(self._record_lines(record))
+        if self.memory:
+            lines.extend(['', 'Most allocating pages:'])
+            for record in self.most_allocating():
+                lines.extend(self._record_lines(record))
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _record_lines(record):
+        memory = ', peak %s KB allocated' % record['allocated_kb'] if record['allocated_kb'] is not None else ''
+        lines = ['  %.3f sec%s  %s' % (record['seconds'], memory, record['url'])]
+        for function, calls, own_time, cumulative_time in record['functions']:
+            lines.append('      %10.6f own %10.6f cumulative %8s calls  %s'
+                         % (own_time, cumulative_time, calls, function))
+        return lines
+
+    def dump(self, path=None):
+        """ Write report to path or report_path, json if the file name ends with .json, otherwise text """
+        path = path or self.report_path
+        with open(path, 'w', encoding='utf-8') as file:
+            if path.endswith('.json'):
+                json.dump(self.report(), file, ensure_ascii=False, indent=4)
+            else:
+                file.write(self.to_text())
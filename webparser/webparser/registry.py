@@ -0,0 +1,25 @@
+import importlib
+
+
+# site name -> dotted path of BaseParser subclass, modules are imported only when the site is used
+SITE_PARSERS = {'ria': 'site_parsers.RIA_parser.RIA_Parser',
+                'mir24': 'site_parsers.MIR24_parser.MIR24_Parser',
+                'profile': 'site_parsers.Profile_parser.ProfileParser'}
+
+
+def register(name, dotted_path):
+    """ Add parser of a new site, dotted_path is 'package.module.ClassName' """
+    SITE_PARSERS[name] = dotted_path
+
+
+def sites():
+    return sorted(SITE_PARSERS)
+
+
+def load_parser_class(name):
+    try:
+        dotted_path = SITE_PARSERS[name]
+    except KeyError:
+        raise KeyError('Unknown site %s, known sites: %s' % (name, ', '.join(sites()))) from None
+    module_name, class_name = dotted_path.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), class_name)
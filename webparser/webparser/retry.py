@@ -0,0 +1,89 @@
+import random
+import time
+
+from webparser.scheduler import url_host
+
+
+class RetryPolicy():
+    """
+     Decides which failed requests are repeated and how long to wait before the next attempt.
+     Failures are classified by RequestFailed.reason, delay grows exponentially with full jitter.
+    """
+    retry_on = frozenset(['timeout', 'connection', 'server_error', 'too_many_requests'])
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=30, retry_on=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        if retry_on is not None:
+            self.retry_on = frozenset(retry_on)
+
+    def should_retry(self, error, attempt):
+        """ attempt is the number of the failed attempt, starting from 1 """
+        return attempt < self.max_attempts and error.reason in self.retry_on
+
+    def delay(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        # the server knows better when it is ready
+        if retry_after:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+class CircuitBreaker():
+    """
+     After failure_threshold failures in a row requests to the host fail fast for reset_timeout seconds.
+     Only failures which mean that the host is down are counted: timeouts, connection errors, 502, 503, 504.
+     Then one trial request is allowed: its success closes the circuit, its failure opens it again.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = 'closed'
+        self._opened_at = 0
+
+    def allow(self):
+        if self.state == 'closed':
+            return True
+        # only one trial request per reset_timeout, also if the previous trial never finished
+        if self.retry_in() == 0:
+            self.state = 'half-open'
+            self._opened_at = time.monotonic()
+            return True
+        return False
+
+    def retry_in(self):
+        """ Seconds until the circuit lets the trial request through """
+        return max(0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def record_success(self):
+        self.failures = 0
+        self.state = 'closed'
+
+    @staticmethod
+    def is_host_failure(error):
+        return error.reason in ('timeout', 'connection') or error.status_code in (502, 503, 504)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == 'half-open' or self.failures >= self.failure_threshold:
+            self.state = 'open'
+            self._opened_at = time.monotonic()
+
+
+class CircuitBreakers():
+    """ Keeps a CircuitBreaker for every host """
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = {}
+
+    def breaker(self, url):
+        host = url_host(url)
+        if host not in self._breakers:
+            self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return self._breakers[host]
+
+    def stats(self):
+        return {host: breaker.state for host, breaker in self._breakers.items()}
@@ -0,0 +1,234 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+
+def url_host(url):
+    """ Host of the url without www, limits are applied to it """
+    host = urlsplit(url).hostname or ''
+    if host.startswith('www.'):
+        host = host[4:]
+    return host
+
+
+def parse_retry_after(value):
+    """ Convert value of Retry-After header (seconds or http date) to seconds, None if it can't be parsed """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_date.tzinfo is None:
+        retry_date = retry_date.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_date - datetime.now(timezone.utc)).total_seconds())
+
+
+class TokenBucket():
+    """
+     Classic token bucket: `rate` tokens are added per second, at most `capacity` are stored.
+     Every request takes one token, if there are no tokens the request waits for its turn.
+    """
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0
+        # shared by sync and async callers, reservation itself never blocks
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """ Take one token and return how many seconds the caller has to wait before using it """
+        with self._lock:
+            now = time.monotonic()
+            blocked = max(0, self._blocked_until - now)
+            if not self.rate:
+                return blocked
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # tokens may go negative, it is the queue of callers that already reserved their turn
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return blocked
+            return blocked - self._tokens / self.rate
+
+    def block(self, seconds):
+        """ Don't give out tokens for the given number of seconds (for example, because of Retry-After) """
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def acquire(self):
+        time.sleep(self.reserve())
+
+    async def async_acquire(self):
+        await asyncio.sleep(self.reserve())
+
+
+class HostLimiter():
+    """
+     Limits the rate of requests and the number of requests in flight for one host.
+     If adaptive, limits are controlled by AIMD: they are halved when the host signals that we are too fast
+     (429, 403, 5xx, timeouts) and grow back by small steps after a series of successful requests,
+     but never above the configured values.
+    """
+    # don't decrease limits again for the failures of requests which were sent before the last decrease
+    decrease_cooldown = 1
+    min_rate = 0.05
+    rate_increase_step = 0.1
+
+    def __init__(self, host, rate=None, max_in_flight=None, burst=1, adaptive=True):
+        self.host = host
+        self.bucket = TokenBucket(rate, burst)
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._waiters = deque()
+        # in_flight is changed by the event loop and by sync requests from other threads
+        self._lock = threading.Lock()
+
+        self.adaptive = adaptive
+        self._max_rate = rate
+        self._max_in_flight = max_in_flight
+        self._successes = 0
+        self._last_decrease = 0
+        self.backoff_events = deque(maxlen=100)
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def _has_free_slot(self):
+        return not self.max_in_flight or self.in_flight < self.max_in_flight
+
+    async def __aenter__(self):
+        while True:
+            # waiter is added under the lock, so a sync request which frees the slot at the moment sees it
+            with self._lock:
+                if self._has_free_slot():
+                    self.in_flight += 1
+                    break
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif waiter.done() and not waiter.cancelled():
+                    # it was woken up for a free slot, pass the slot to the next waiter
+                    self._wake_up_waiters()
+                raise
+        try:
+            await self.bucket.async_acquire()
+        except BaseException:
+            await self.__aexit__()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        with self._lock:
+            self.in_flight -= 1
+        self._wake_up_waiters()
+
+    # Sync requests are made one by one, so only the rate applies to them, but they take slots of async ones
+    def __enter__(self):
+        with self._lock:
+            self.in_flight += 1
+        try:
+            self.bucket.acquire()
+        except BaseException:
+            self.__exit__()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        with self._lock:
+            self.in_flight -= 1
+            loops = {waiter.get_loop() for waiter in self._waiters}
+        # async requests could wait for the freed slot, they are woken up in the thread of their loop
+        for loop in loops:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(self._wake_up_waiters)
+
+    def record_success(self):
+        """ Additive increase: after enough successes in a row raise limits by one step """
+        if not self.adaptive:
+            return
+        self._successes += 1
+        if self._successes < max(self.max_in_flight or 1, 5):
+            return
+        self._successes = 0
+        if self.max_in_flight and self.max_in_flight < self._max_in_flight:
+            self.max_in_flight += 1
+            self._wake_up_waiters()
+        if self.rate and self.rate < self._max_rate:
+            self.bucket.rate = min(self._max_rate, self.rate + self._max_rate * self.rate_increase_step)
+
+    def record_failure(self, reason, retry_after=None):
+        """ Multiplicative decrease after a blocking signal from the host """
+        if not self.adaptive:
+            return
+        self._successes = 0
+        if retry_after:
+            self.bucket.block(retry_after)
+
+        now = time.monotonic()
+        if now - self._last_decrease < self.decrease_cooldown:
+            return
+        self._last_decrease = now
+        if self.max_in_flight:
+            self.max_in_flight = max(1, self.max_in_flight // 2)
+        if self.rate:
+            self.bucket.rate = max(self.min_rate, self.rate / 2)
+        self.backoff_events.append({'time': datetime.now().isoformat(timespec='seconds'), 'reason': reason,
+                                    'retry_after': retry_after, 'rate': self.rate,
+                                    'max_in_flight': self.max_in_flight})
+
+    def stats(self):
+        return {'rate': self.rate, 'max_in_flight': self.max_in_flight, 'in_flight': self.in_flight,
+                'backoff_events': list(self.backoff_events)}
+
+    def _wake_up_waiters(self):
+        free_slots = self.max_in_flight - self.in_flight if self.max_in_flight else len(self._waiters)
+        while self._waiters and free_slots > 0:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free_slots -= 1
+
+
+class HostScheduler():
+    """
+     Keeps a HostLimiter for every host, so requests to different sites don't wait for each other.
+     host_limits allows to override default limits for some hosts: {'ria.ru': {'rate': 2, 'max_in_flight': 4}}
+    """
+    def __init__(self, rate=None, max_in_flight=None, burst=1, host_limits=None, adaptive=True):
+        self.default_limits = {'rate': rate, 'max_in_flight': max_in_flight, 'burst': burst, 'adaptive': adaptive}
+        self.host_limits = host_limits or {}
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, url):
+        """ Return limiter for the host of the given url """
+        host = url_host(url)
+        with self._lock:
+            if host not in self._limiters:
+                limits = dict(self.default_limits, **self.host_limits.get(host, {}))
+                self._limiters[host] = HostLimiter(host, **limits)
+            return self._limiters[host]
+
+    @property
+    def limiters(self):
+        return dict(self._limiters)
+
+    def stats(self):
+        """ Current limits and backoff events of every host """
+        return {host: limiter.stats() for host, limiter in self.limiters.items()}
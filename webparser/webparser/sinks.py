@@ -0,0 +1,69 @@
+import json
+
+from webparser.models import Article
+
+
+class JSONLinesSink():
+    """
+     Writes parsed pages to a JSON Lines file, one {"url": ..., "data": ...} object per line.
+     Lines are written as soon as pages are ready, so results of a long run are not kept in memory.
+     path can also be an open text file (sys.stdout for example), it's not closed by the sink.
+    """
+    def __init__(self, path, mode='a', flush_every=100):
+        self.path = path
+        self._own_file = not hasattr(path, 'write')
+        self._file = open(path, mode, encoding='utf-8') if self._own_file else path
+        self._flush_every = flush_every
+        self.written = 0
+
+    def write(self, url, json_data):
+        self._file.write(json.dumps({'url': url, 'data': json_data}, ensure_ascii=False, default=_to_record))
+        self._file.write('\n')
+        self.written += 1
+        if self.written % self._flush_every == 0:
+            self._file.flush()
+
+    def close(self):
+        if self._own_file:
+            self._file.close()
+        else:
+            self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ArticleSink(JSONLinesSink):
+    """ Writes Article objects in compact form, one Article.to_record per line, read them with read_articles """
+    def write(self, url, article):
+        self._file.write(article.dumps())
+        self._file.write('\n')
+        self.written += 1
+        if self.written % self._flush_every == 0:
+            self._file.flush()
+
+
+def _to_record(value):
+    if isinstance(value, Article):
+        return value.to_record()
+    raise TypeError('Object of type %s is not JSON serializable' % value.__class__.__name__)
+
+
+def read_articles(path):
+    """ Iterate over Article objects written by ArticleSink """
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield Article.loads(line)
+
+
+def read_json_lines(path):
+    """ Iterate over (url, page_content) written by JSONLinesSink """
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                yield record['url'], record['data']
@@ -0,0 +1,58 @@
+# bs4 and lxml are imported by make_soup with the first page, so site parsers can be loaded without them
+
+
+def class_xpath(class_name, tag='*'):
+    """ XPath for tags with the class, like find(tag, {'class': class_name}) in BeautifulSoup """
+    return "//%s[contains(concat(' ', normalize-space(@class), ' '), ' %s ')]" % (tag, class_name)
+
+
+_compiled_xpaths = {}
+_html_parsers = {}
+
+def _compile(subtrees):
+    from lxml import etree
+
+    if subtrees not in _compiled_xpaths:
+        # union keeps document order, so find() returns the same tag as in the whole document
+        _compiled_xpaths[subtrees] = etree.XPath(' | '.join(subtrees))
+    return _compiled_xpaths[subtrees]
+
+
+def _html_parser(encoding):
+    import lxml.html
+
+    if encoding not in _html_parsers:
+        _html_parsers[encoding] = lxml.html.HTMLParser(encoding=encoding)
+    return _html_parsers[encoding]
+
+
+def make_soup(html_data, subtrees=None):
+    """
+     Build BeautifulSoup only from the parts of the page matched by subtrees (tuple of XPath expressions).
+     The page is parsed by lxml, which is much faster than building BeautifulSoup tree of the whole page,
+     and only the needed parts are passed to BeautifulSoup. Without subtrees the whole page is used.
+     html_data is str or bytes, encoding of bytes is taken from their encoding attribute (RawPage)
+     or detected by lxml.
+    """
+    from bs4 import BeautifulSoup
+    import lxml.html
+    from lxml import etree
+
+    encoding = getattr(html_data, 'encoding', None) if isinstance(html_data, bytes) else None
+    if not subtrees or not html_data.strip():
+        return BeautifulSoup(html_data, 'lxml', from_encoding=encoding)
+    try:
+        tree = lxml.html.document_fromstring(html_data, parser=_html_parser(encoding))
+    except (ValueError, etree.ParserError):
+        # for example, str with xml encoding declaration
+        return BeautifulSoup(html_data, 'lxml', from_encoding=encoding)
+
+    elements = _compile(tuple(subtrees))(tree)
+    selected = set(elements)
+    fragments = []
+    for element in elements:
+        # nested matches are already inside of the parent fragment
+        if any(ancestor in selected for ancestor in element.iterancestors()):
+            continue
+        fragments.append(lxml.html.tostring(element, encoding='unicode', with_tail=False))
+    return BeautifulSoup(''.join(fragments), 'lxml')
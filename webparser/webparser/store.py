@@ -0,0 +1,210 @@
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from webparser.models import Article
+from webparser.scheduler import url_host
+
+
+class _Gzip():
+    extension = '.jsonl.gz'
+
+    @staticmethod
+    def compress(data):
+        return gzip.compress(data)
+
+    @staticmethod
+    def decompress(data):
+        return gzip.decompress(data)
+
+
+class _Zstd():
+    extension = '.jsonl.zst'
+
+    def __init__(self):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('zstd compression requires zstandard package: pip install zstandard') from None
+        self._compressor = zstandard.ZstdCompressor()
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def decompress(self, data):
+        return self._decompressor.decompress(data)
+
+
+class ShardedStore():
+    """
+     Stores parsed pages in compressed JSON Lines shards: <root>/<site>/<publication day>/part-NNNNN.jsonl.gz,
+     a shard is rotated when it grows over max_shard_bytes. Records are compressed in blocks of block_records
+     lines, every block is a separate gzip member (zstd frame), so the file is still a valid .gz (.zst) file
+     and one block can be read without decompressing the whole shard.
+     SQLite index <root>/index.sqlite keeps for every url its shard, offset and length of the block,
+     line in the block and publication date, so get and iter_range read only the needed blocks.
+     Appending is cheap: new blocks are added to the end of the last shard.
+     Not full blocks of all days are written too when more than max_pending_records records or max_pending_bytes
+     wait for compression or flush_interval sec passed, so memory doesn't grow with the number of days.
+     It's a sink for parse_to and Orchestrator.crawl, pages are Article objects or dicts.
+    """
+    def __init__(self, root, compression='gzip', max_shard_bytes=64 * 1024 * 1024, block_records=100,
+                 max_pending_records=1000, max_pending_bytes=8 * 1024 * 1024, flush_interval=30):
+        self.root = root
+        self.max_shard_bytes = max_shard_bytes
+        self.block_records = block_records
+        self.max_pending_records = max_pending_records
+        self.max_pending_bytes = max_pending_bytes
+        self.flush_interval = flush_interval
+        self._codec = _Zstd() if compression == 'zstd' else _Gzip()
+        self.written = 0
+        # (site, day) -> [(url, published, line)], records waiting to be compressed
+        self._pending = {}
+        self._pending_records = 0
+        self._pending_bytes = 0
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._connection = sqlite3.connect(os.path.join(root, 'index.sqlite'), check_same_thread=False)
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS pages ('
+                                     'site TEXT, url TEXT, published TEXT, shard TEXT, offset INTEGER, '
+                                     'length INTEGER, line INTEGER, PRIMARY KEY (site, url))')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS pages_published ON pages (site, published)')
+
+    def write(self, url, json_data):
+        if isinstance(json_data, Article):
+            site, published, line = json_data.site, json_data.published, json_data.dumps()
+        else:
+            site, published = url_host(url), self._published(json_data)
+            line = json.dumps({'url': url, 'data': json_data}, ensure_ascii=False, separators=(',', ':'))
+        published = published.strftime('%Y-%m-%d %H:%M') if published else None
+        day = published[:10] if published else 'undated'
+        with self._lock:
+            block = self._pending.setdefault((site, day), [])
+            block.append((url, published, line))
+            self.written += 1
+            self._pending_records += 1
+            self._pending_bytes += len(line)
+            if len(block) >= self.block_records:
+                self._pending_records -= len(block)
+                self._pending_bytes -= sum(len(record[2]) for record in block)
+                self._write_block(site, day, self._pending.pop((site, day)))
+            if (self._pending_records >= self.max_pending_records or self._pending_bytes >= self.max_pending_bytes
+                    or time.monotonic() - self._flushed_at >= self.flush_interval):
+                self._write_pending()
+
+    @staticmethod
+    def _published(json_data):
+        """ Publication date of process_parse_page dict """
+        published = json_data.get('publication_date') if isinstance(json_data, dict) else None
+        if isinstance(published, dict):
+            return datetime(published['year'], published['month'], published['day'],
+                            published['hour'], published['minute'])
+        if isinstance(published, str):
+            try:
+                return datetime.fromisoformat(published)
+            except ValueError:
+                return None
+        return None
+
+    def _shard_path(self, site, day):
+        """ The last shard of the day or a new one if it's full """
+        directory = os.path.join(self.root, site, day)
+        os.makedirs(directory, exist_ok=True)
+        parts = sorted(name for name in os.listdir(directory) if name.endswith(self._codec.extension))
+        number = len(parts) - 1 if parts else 0
+        if parts and os.path.getsize(os.path.join(directory, parts[-1])) >= self.max_shard_bytes:
+            number += 1
+        return os.path.join(site, day, 'part-%05d%s' % (number, self._codec.extension))
+
+    def _write_block(self, site, day, block):
+        data = self._codec.compress(''.join(line + '\n' for _, _, line in block).encode('utf-8'))
+        shard = self._shard_path(site, day)
+        with open(os.path.join(self.root, shard), 'ab') as file:
+            offset = file.tell()
+            file.write(data)
+        with self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                         [(site, url, published, shard, offset, len(data), number)
+                                          for number, (url, published, _) in enumerate(block)])
+
+    def _write_pending(self):
+        for (site, day), block in self._pending.items():
+            self._write_block(site, day, block)
+        self._pending = {}
+        self._pending_records = 0
+        self._pending_bytes = 0
+        self._flushed_at = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._write_pending()
+
+    def _read_block(self, shard, offset, length):
+        with open(os.path.join(self.root, shard), 'rb') as file:
+            file.seek(offset)
+            return self._codec.decompress(file.read(length)).decode('utf-8').split('\n')
+
+    @staticmethod
+    def _load(line):
+        record = json.loads(line)
+        if 'data' in record:
+            return record['url'], record['data']
+        return record['url'], Article.from_record(record)
+
+    def get(self, url, site=None):
+        """ Page content of the url (Article or dict) or None """
+        self.flush()
+        with self._lock:
+            row = self._connection.execute('SELECT shard, offset, length, line FROM pages WHERE site = ? AND url = ?',
+                                           (site or url_host(url), url)).fetchone()
+        if not row:
+            return None
+        shard, offset, length, line = row
+        return self._load(self._read_block(shard, offset, length)[line])[1]
+
+    def iter_range(self, site, start=None, end=None):
+        """
+         Iterate over (url, page_content) of the site published from start to end (datetime or date, inclusive),
+         every needed block is decompressed once
+        """
+        self.flush()
+        query = 'SELECT shard, offset, length, line FROM pages WHERE site = ?'
+        params = [site]
+        if start:
+            query += ' AND published >= ?'
+            params.append(start.strftime('%Y-%m-%d %H:%M'))
+        if end:
+            query += ' AND published <= ?'
+            # the whole day for date
+            params.append(end.strftime('%Y-%m-%d %H:%M') if isinstance(end, datetime)
+                          else end.strftime('%Y-%m-%d 23:59'))
+        with self._lock:
+            rows = self._connection.execute(query + ' ORDER BY shard, offset, line', params).fetchall()
+        block_key, lines = None, None
+        for shard, offset, length, line in rows:
+            if (shard, offset) != block_key:
+                block_key, lines = (shard, offset), self._read_block(shard, offset, length)
+            yield self._load(lines[line])
+
+    def urls(self, site):
+        self.flush()
+        with self._lock:
+            return [row[0] for row in self._connection.execute('SELECT url FROM pages WHERE site = ?', (site,))]
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()